@@ -0,0 +1,162 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from campaign_store import build_store, clear_loaded, read_scan_files
+from extract_data import build_HV_dataframe, build_WP_dataframe
+from pipeline import mixtures, read_bkg
+from prefetch import fit_streaming
+from sigmoid_fit import derive_working_points, fit_sigmoid_dfs, sigmoid, take_fits
+from wp_index import clear_wp_index, wp_index
+
+# Benchmark das etapas do pipeline (Parquet, índice de WPs, leitura, ajuste, WP, leitura+ajuste com
+# prefetch, desenho) sobre campanhas sintéticas com as mesmas colunas de data_2024/STDMX_10.csv.
+
+def synthetic_rows(rng, HV, Emax, Lambda, HV50, bkg, n_muons=3000):
+    """ Linhas de um scan (colunas de extract_data) para uma sigmoide e uma taxa de background (kHz/cm2) """
+    frac = (HV - 6300.) / 1300.
+    eff = rng.binomial(n_muons, sigmoid(HV, Emax, Lambda, HV50)) / n_muons
+    gamma_CS = 1.1 + 1.3 * np.clip(frac, 0., None) + rng.normal(0., 0.02, len(HV))
+    gamma_eff = sigmoid(HV, 1., 0.01, HV50 - 100.)
+    current = 3.5 + 25. * bkg * gamma_eff + rng.normal(0., 0.3, len(HV))
+    rows = []
+    for i in range(len(HV)):
+        rows.append({
+            'HV_top': HV[i], 'HV_bot': HV[i],
+            'current_top': current[i] * 0.6, 'current_bot': current[i] * 0.4,
+            'muon_stream': max(0.07 * frac[i] + rng.normal(0., 0.005), 0.),
+            'gamma_stream': max(0.07 * frac[i] + rng.normal(0., 0.005), 0.),
+            'muon_CM': 1. + 0.15 * frac[i], 'gamma_CM': 1.1 + 2.2 * frac[i],
+            'muon_CS': 1. + 2. * frac[i], 'gamma_CS': gamma_CS[i],
+            'muon_CM_err': 0.1 * frac[i], 'gamma_CM_err': 0.16 * frac[i],
+            'muon_CS_err': 0.2 * frac[i], 'gamma_CS_err': 0.1 * frac[i],
+            'efficiency': eff[i],
+            'eff_error': np.sqrt(max(eff[i] * (1. - eff[i]), 1. / n_muons) / n_muons),
+            'noiseGammaRate': bkg * 1000. * gamma_CS[i] * gamma_eff[i],
+            'noiseGammaRate_err': 0.05 * bkg * 1000. * gamma_CS[i] * gamma_eff[i],
+        })
+    return rows
+
+
+def synthetic_campaign(folder, n_configs, n_points=10, seed=0):
+    """ Grava n_configs pares <mistura>_<ABS>.csv / _WP.csv em 'folder'; devolve (arquivos HV, arquivos WP) """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    files, WP_files = [], []
+    for i in range(n_configs):
+        mixture, ABS = mixtures[i % len(mixtures)], 1. + 0.01 * (i // len(mixtures))
+        bkg = 2.5 / ABS
+        Emax = min(0.99 - 0.03 * bkg + rng.normal(0., 0.005), 0.999)
+        HV50 = 6800. + 60. * bkg + rng.normal(0., 20.)
+        Lambda = 0.012 + rng.normal(0., 0.001)
+        HV = 6300. + 100. * np.arange(n_points)
+        tasks = [(folder, "0", j + 1) for j in range(n_points)]
+        name = os.path.join(folder, f"{mixture}_{ABS:g}")
+        build_HV_dataframe(tasks, synthetic_rows(rng, HV, Emax, Lambda, HV50, bkg)).to_csv(f"{name}.csv", index=False)
+        WP = HV50 + np.log(19.) / Lambda + 150.
+        WP_rows = synthetic_rows(rng, np.array([WP]), Emax, Lambda, HV50, bkg)
+        build_WP_dataframe(WP_rows).to_csv(f"{name}_WP.csv", index=False)
+        files.append(f"{name}.csv")
+        WP_files.append(f"{name}_WP.csv")
+    return files, WP_files
+
+
+@contextlib.contextmanager
+def measure(records, size, stage, n_items):
+    """ Tempo e memória (tracemalloc, se ativo) de uma etapa; acrescenta uma linha em 'records' """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory() if tracing else (np.nan, np.nan)
+    records.append({'size': size, 'stage': stage, 'seconds': seconds,
+                    'items_per_s': n_items / seconds if seconds > 0 else np.inf,
+                    'current_MB': current / 2**20, 'peak_MB': peak / 2**20, 't': time.perf_counter()})
+
+
+def run_size(records, folder, size, n_points, seed, workers, render_limit):
+    files, WP_files = synthetic_campaign(folder, size, n_points, seed)
+
+    # Parquet e índice de WPs são construídos em etapas próprias, fora da leitura e do WP
+    with measure(records, size, 'store', size):
+        build_store(folder)
+    with measure(records, size, 'wp_index', size):
+        clear_wp_index()
+        wp_index(folder)
+    with measure(records, size, 'load', size):
+        clear_loaded()
+        dfs = read_scan_files(files)
+    with measure(records, size, 'fit', size):
+        result = fit_sigmoid_dfs(dfs)
+    with measure(records, size, 'derive', size):
+        derive_working_points(result)
+        [read_bkg(WP_file) for WP_file in WP_files]
+    # Leitura direta dos CSVs com prefetch, sobreposta aos ajustes em blocos
+    with measure(records, size, 'stream', size):
+        fit_streaming(files, pd.read_csv)
+
+    n_render = min(size, render_limit)
+    if n_render and importlib.util.find_spec("ROOT") is not None:
+        from eff_vs_HV import overlay_spec
+        from render import render_many
+
+        # Só o processo principal entra no tracemalloc; os workers do desenho não são medidos
+        with measure(records, size, 'render', n_render), contextlib.redirect_stdout(io.StringIO()):
+            specs = [overlay_spec([dfs[i]], take_fits(result, [i]), [WP_files[i]],
+                                  os.path.join(folder, f"render_{i}.png"))
+                     for i in range(n_render)]
+            render_many(specs, workers)
+
+
+def run_benchmark(sizes, n_points=10, seed=0, workers=None, render_limit=200, memory=True):
+    """ Roda todas as etapas para cada tamanho de campanha (número de configurações)
+
+    O tracemalloc deixa a leitura com pandas algumas vezes mais lenta: memory=False mede só o tempo.
+    """
+    records = []
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        for size in sizes:
+            with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+                run_size(records, os.path.join(tmp, "data_2099"), size, n_points, seed, workers, render_limit)
+    finally:
+        tracemalloc.stop()
+    report = pd.DataFrame(records)
+    if len(report):
+        report['t'] -= start
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de leitura, ajuste, WP e desenho em campanhas sintéticas")
+    parser.add_argument("sizes", nargs="*", type=int, help="números de configurações (padrão: 100 1000 5000)")
+    parser.add_argument("--points", type=int, default=10, help="pontos HV por scan")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processos para o desenho (padrão: todos os núcleos)")
+    parser.add_argument("--render-limit", type=int, default=200, help="máximo de gráficos desenhados por tamanho (0 desliga)")
+    parser.add_argument("--no-memory", action="store_true", help="sem tracemalloc: tempos sem o custo do rastreamento")
+    parser.add_argument("-o", "--output", default=None, help="CSV com o relatório")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes or [100, 1000, 5000], args.points, args.seed, args.workers, args.render_limit,
+                           not args.no_memory)
+    print(report.to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+    if args.output:
+        report.to_csv(args.output, index=False)
+        print(f"Arquivo salvo: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from sigmoid_fit import FIT_OK, derive_working_points, fit_sigmoid_batch
+
+# Incerteza do platô, HV50 e WP por toy MC: cada toy sorteia as eficiências
+# de um scan dentro de eff_error e é reajustado pelo ajuste vetorizado.
+
+toy_quantities = ('Emax', 'HV50', 'WP')
+
+
+def _toy_chunk(task):
+    x, y, err, mask, p0, n_toys, seed = task
+    rng = np.random.default_rng(seed)
+    y_toys = y + rng.standard_normal((n_toys, len(y))) * np.where(mask, err, 0.)
+    tile = lambda a: np.broadcast_to(a, (n_toys, len(a)))
+    fits = fit_sigmoid_batch(tile(x), y_toys, tile(err), tile(mask), p0)
+    ok = fits['status'] == FIT_OK
+    points = derive_working_points(fits)
+    values = {'Emax': fits['Emax'], 'HV50': points['HV50'], 'WP': points['WP']}
+    return {name: values[name][ok] for name in toy_quantities}
+
+
+def toy_intervals(x, y, err, mask, params, n_toys=10000, seed=0, workers=None, chunk_size=2000, cl=0.68):
+    """ Intervalos de confiança (quantis centrais 'cl') de Emax, HV50 e WP para cada scan
+
+    x, y, err, mask: arrays empilhados (stack_scans); params: ajuste nominal, usado como ponto de partida.
+    A semente de cada bloco de toys depende só de (seed, scan, bloco): o resultado não muda com workers.
+    """
+    tasks, owners = [], []
+    for i in range(x.shape[0]):
+        for j, start in enumerate(range(0, n_toys, chunk_size)):
+            seed_ij = np.random.SeedSequence(seed, spawn_key=(i, j))
+            tasks.append((x[i], y[i], err[i], mask[i], params[i], min(chunk_size, n_toys - start), seed_ij))
+            owners.append(i)
+
+    if workers == 1:
+        chunks = [_toy_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            chunks = list(executor.map(_toy_chunk, tasks))
+
+    q = [(1. - cl) / 2., 0.5, (1. + cl) / 2.]
+    rows = [{} for _ in range(x.shape[0])]
+    for i, row in enumerate(rows):
+        mine = [chunk for chunk, owner in zip(chunks, owners) if owner == i]
+        for name in toy_quantities:
+            values = np.concatenate([chunk[name] for chunk in mine])
+            lo, median, hi = np.quantile(values, q) if len(values) else (np.nan,) * 3
+            row.update({f"{name}_lo": lo, f"{name}_median": median, f"{name}_hi": hi})
+        row['toys_ok'] = sum(len(chunk['Emax']) for chunk in mine)
+    return pd.DataFrame(rows)
@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrument import span
+from persistent_cache import file_signature
+
+# Um único arquivo Parquet por campanha no lugar dos ~60 CSVs de data_YYYY
+store_name = "campaign.parquet"
+partition_columns = ['year', 'mixture', 'ABS', 'scan_type', 'point']
+
+# Ordem das colunas nos CSVs gerados por extract_data
+csv_columns = {
+    'HV': ['HV_top', 'HV_bot', 'current_top', 'current_bot', 'muon_stream', 'gamma_stream', 'muon_CM', 'gamma_CM',
+           'muon_CS', 'gamma_CS', 'muon_CM_err', 'gamma_CM_err', 'muon_CS_err', 'gamma_CS_err', 'efficiency',
+           'eff_error', 'noiseGammaRate', 'deltaV', 'current', 'deltaV_err'],
+    'WP': ['current_top', 'current_bot', 'HV_top', 'HV_bot', 'muon_stream', 'gamma_stream', 'muon_CM', 'gamma_CM',
+           'muon_CS', 'gamma_CS', 'muon_CM_err', 'gamma_CM_err', 'muon_CS_err', 'gamma_CS_err', 'efficiency',
+           'eff_error', 'noiseGammaRate', 'noiseGammaRate_err', 'current'],
+}
+
+# ABS "OFF" (fonte desligada) é guardado como inf
+ABS_OFF = np.inf
+
+
+def ABS_value(label):
+    return ABS_OFF if label == "OFF" else float(label)
+
+
+def ABS_label(value):
+    return "OFF" if np.isinf(value) else f"{value:g}"
+
+
+def parse_scan_name(file_name):
+    """ 'STDMX_10_WP.csv' -> ('STDMX', 10.0, 'WP') """
+    base = os.path.splitext(os.path.basename(file_name))[0]
+    scan_type = "HV"
+    if base.endswith("_WP"):
+        base, scan_type = base[:-3], "WP"
+    mixture, ABS = base.split("_", 1)
+    return mixture, ABS_value(ABS), scan_type
+
+
+def scan_key(file_name):
+    """ parse_scan_name, ou None para arquivos fora do padrão <mistura>_<ABS>[_WP].csv """
+    try:
+        return parse_scan_name(file_name)
+    except ValueError:
+        return None
+
+
+def scan_file_name(mixture, ABS, scan_type):
+    suffix = "_WP" if scan_type == "WP" else ""
+    return f"{mixture}_{ABS_label(ABS)}{suffix}.csv"
+
+
+def folder_year(data_folder):
+    match = re.search(r"(\d{4})", os.path.basename(os.path.normpath(data_folder)))
+    return int(match.group(1)) if match else 0
+
+
+def store_path(data_folder):
+    return os.path.join(data_folder, store_name)
+
+
+def csv_files(data_folder):
+    """ CSVs de scan da pasta; outros CSVs (ex: resumos) não entram no Parquet """
+    return sorted(entry.path for entry in os.scandir(data_folder)
+                  if entry.is_file() and entry.name.endswith(".csv") and scan_key(entry.name) is not None)
+
+
+def source_signatures(data_folder):
+    """ {CSV: (mtime, tamanho)} dos arquivos que compõem o Parquet """
+    return {os.path.basename(file): file_signature(file) for file in csv_files(data_folder)}
+
+
+def stored_signatures(path):
+    """ Assinaturas gravadas nos metadados do Parquet, ou None se ilegíveis """
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    sources = metadata.get(b"sources")
+    return None if sources is None else json.loads(sources)
+
+
+def is_stale(data_folder):
+    """ O Parquet precisa ser refeito se algum CSV foi criado, apagado ou modificado (mtime ou tamanho) """
+    path = store_path(data_folder)
+    if not os.path.isfile(path):
+        return True
+    return stored_signatures(path) != source_signatures(data_folder)
+
+
+def build_store(data_folder, year=None):
+    """ Consolida os CSVs de uma pasta data_YYYY num único Parquet """
+    year = folder_year(data_folder) if year is None else year
+    with span("build_store", folder=data_folder):
+        store = _build_store(data_folder, year)
+    return store
+
+
+def _build_store(data_folder, year):
+    # Assinaturas tiradas antes da leitura: um CSV alterado durante a construção deixa o Parquet desatualizado
+    sources = source_signatures(data_folder)
+    ignored = sorted(entry.name for entry in os.scandir(data_folder)
+                     if entry.name.endswith(".csv") and scan_key(entry.name) is None)
+    if ignored:
+        print(f"Aviso: CSVs fora do padrão <mistura>_<ABS>.csv ignorados em {data_folder}: {', '.join(ignored)}")
+    frames = []
+    for file in csv_files(data_folder):
+        mixture, ABS, scan_type = parse_scan_name(file)
+        df = pd.read_csv(file)
+        df.insert(0, 'point', np.arange(len(df), dtype=np.int32))
+        df.insert(0, 'scan_type', scan_type)
+        df.insert(0, 'ABS', ABS)
+        df.insert(0, 'mixture', mixture)
+        df.insert(0, 'year', np.int32(year))
+        frames.append(df)
+
+    store = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=partition_columns)
+    # Ordenado pelas colunas de partição: as estatísticas dos row groups permitem pular dados nos filtros
+    store = store.sort_values(['mixture', 'scan_type', 'ABS', 'point'], kind='stable', ignore_index=True)
+    store['mixture'] = store['mixture'].astype('category')
+    store['scan_type'] = store['scan_type'].astype('category')
+    # Gravado ao lado e renomeado: um leitor nunca vê um Parquet pela metade
+    tmp = store_path(data_folder) + ".tmp"
+    table = pa.Table.from_pandas(store, preserve_index=False)
+    table = table.replace_schema_metadata({**table.schema.metadata, b"sources": json.dumps(sources).encode()})
+    pq.write_table(table, tmp, row_group_size=1024)
+    os.replace(tmp, store_path(data_folder))
+    return store
+
+
+def load_campaign(data_folder, mixtures=None, ABS=None, scan_type=None, columns=None):
+    """ Lê a campanha (reconstruindo o Parquet se algum CSV mudou) com filtros aplicados na leitura """
+    if is_stale(data_folder):
+        build_store(data_folder)
+
+    filters = []
+    if mixtures is not None:
+        filters.append(('mixture', 'in', list(mixtures)))
+    if ABS is not None:
+        filters.append(('ABS', 'in', [ABS_value(a) if isinstance(a, str) else float(a) for a in ABS]))
+    if scan_type is not None:
+        filters.append(('scan_type', '==', scan_type))
+    if columns is not None:
+        columns = list(dict.fromkeys(partition_columns + list(columns)))
+    return pd.read_parquet(store_path(data_folder), filters=filters or None, columns=columns)
+
+
+# Campanhas já carregadas neste processo (pasta -> DataFrame de cada configuração)
+_loaded = {}
+# read_scan_file é chamado de várias threads (prefetch): só uma constrói e carrega o Parquet
+_loaded_lock = threading.Lock()
+
+
+def _campaign(data_folder):
+    path = store_path(data_folder)
+    with _loaded_lock:
+        if path not in _loaded:
+            if is_stale(data_folder):
+                build_store(data_folder)
+            _loaded[path] = scan_frames(pd.read_parquet(path))
+        return _loaded[path]
+
+
+def clear_loaded():
+    with _loaded_lock:
+        _loaded.clear()
+
+
+def scan_frames(store):
+    """ {(mistura, ABS, tipo): DataFrame igual ao do CSV}, montados de uma vez a partir das colunas do Parquet
+
+    O Parquet é gravado ordenado por configuração e ponto, então cada configuração é uma faixa contígua
+    de linhas: basta fatiar os arrays, sem ordenar nem agrupar DataFrames a cada leitura.
+    """
+    store = store.sort_values(['mixture', 'scan_type', 'ABS', 'point'], kind='stable', ignore_index=True)
+    values = {column: store[column].to_numpy() for column in store.columns if column not in partition_columns}
+    keys = list(zip(store['mixture'].astype(str), store['ABS'].to_numpy(dtype=float), store['scan_type'].astype(str)))
+    frames, start = {}, 0
+    for stop in range(1, len(keys) + 1):
+        if stop < len(keys) and keys[stop] == keys[start]:
+            continue
+        scan_type = keys[start][2]
+        # Colunas do tipo de scan na ordem do CSV; as que só existem no outro tipo ficam todas nan e saem
+        present = [column for column, array in values.items() if not pd.isna(array[start:stop]).all()]
+        order = [column for column in csv_columns[scan_type] if column in present]
+        frames[keys[start]] = pd.DataFrame({column: values[column][start:stop]
+                                            for column in order + [c for c in present if c not in order]})
+        start = stop
+    return frames
+
+
+def read_scan_file(file):
+    """ Equivalente a pd.read_csv(file), mas servido pelo Parquet da campanha
+
+    Arquivos fora do padrão de nomes, ou que o Parquet não contém, são lidos direto do CSV.
+    """
+    with span("read_scan_file", file=file):
+        key = scan_key(file)
+        if key is None:
+            return pd.read_csv(file)
+        frames = _campaign(os.path.dirname(file) or ".")
+        if key not in frames:
+            return pd.read_csv(file)
+        # Cópia: quem chama pode alterar o DataFrame sem mexer no da campanha carregada
+        return frames[key].copy()
+
+
+def read_scan_files(files):
+    return [read_scan_file(file) for file in files]
+
+
+def export_csv(data_folder, output_folder, mixtures=None, ABS=None, scan_type=None):
+    """ Saída opcional: regrava um CSV por configuração a partir do Parquet (com os filtros de load_campaign) """
+    os.makedirs(output_folder, exist_ok=True)
+    files = []
+    for (mixture, ABS_, type_), df in scan_frames(load_campaign(data_folder, mixtures, ABS, scan_type)).items():
+        files.append(os.path.join(output_folder, scan_file_name(mixture, ABS_, type_)))
+        df.to_csv(files[-1], index=False)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Atualiza o Parquet de uma pasta data_YYYY e, opcionalmente, exporta CSVs dele")
+    parser.add_argument("data_folder", help="pasta com os CSVs da campanha (ex: data_2024)")
+    parser.add_argument("--export", default=None, help="pasta onde regravar um CSV por configuração")
+    parser.add_argument("-m", "--mixtures", nargs="+", default=None, help="só estas misturas na exportação")
+    parser.add_argument("--abs", nargs="+", default=None, help="só estes ABS na exportação (OFF = fonte desligada)")
+    parser.add_argument("--type", choices=["HV", "WP"], default=None, help="só scans HV ou só WP na exportação")
+    args = parser.parse_args()
+    if not os.path.isdir(args.data_folder):
+        parser.error(f"pasta '{args.data_folder}' não encontrada")
+
+    if is_stale(args.data_folder):
+        build_store(args.data_folder)
+    print(f"Parquet atualizado: {store_path(args.data_folder)}")
+    if args.export:
+        files = export_csv(args.data_folder, args.export, args.mixtures, args.abs, args.type)
+        print(f"{len(files)} CSVs exportados em {args.export}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+from render import mixture_style, plot_spec
+
+# Comparação entre campanhas: a tabela de ajustes (pipeline.build_fit_table) é
+# alinhada por (mistura, ABS) para qualquer número de anos, e as diferenças em
+# relação a um ano de referência saem de uma vez, com erros somados em quadratura.
+# Configurações que faltam num ano ficam nan em vez de desalinhar as listas.
+
+compare_quantities = ('Emax', 'WP', 'HV50')
+
+
+def align_campaigns(table, quantities=compare_quantities, years=None):
+    """ Uma linha por (mistura, ABS) e colunas (grandeza, ano); configurações ausentes num ano ficam nan """
+    if years is not None:
+        table = table[table['year'].isin(years)]
+    values = list(quantities) + [f"{quantity}_err" for quantity in quantities]
+    aligned = table.set_index(['mixture', 'ABS', 'year'])[values].unstack('year')
+    return aligned.sort_index(axis=1)
+
+
+def compare_campaigns(table, reference=None, quantities=compare_quantities, years=None):
+    """ Diferenças (ano - referência) de Emax, WP e HV50 por (mistura, ABS) para todos os anos
+
+    reference: ano de referência (padrão: o mais antigo). Devolve uma tabela longa com mistura,
+    ABS, ano, referência e, para cada grandeza, o valor, o da referência, delta_<grandeza> e
+    delta_<grandeza>_err. Pares (mistura, ABS) que faltam em um dos dois anos não aparecem.
+    """
+    aligned = align_campaigns(table, quantities, years)
+    all_years = sorted(aligned[quantities[0]].columns)
+    if reference is None:
+        reference = all_years[0]
+    if reference not in all_years:
+        raise ValueError(f"Ano de referência {reference} não está na tabela (anos: {all_years})")
+
+    frames = []
+    for year in all_years:
+        if year == reference:
+            continue
+        frame = pd.DataFrame({'year': year, 'reference': reference}, index=aligned.index)
+        for quantity in quantities:
+            value, ref = aligned[(quantity, year)], aligned[(quantity, reference)]
+            frame[quantity] = value
+            frame[f"{quantity}_ref"] = ref
+            frame[f"delta_{quantity}"] = value - ref
+            frame[f"delta_{quantity}_err"] = np.hypot(aligned[(f"{quantity}_err", year)],
+                                                      aligned[(f"{quantity}_err", reference)])
+        # Só os pares presentes nas duas campanhas
+        frames.append(frame[value.notna() & ref.notna()])
+    columns = ['mixture', 'ABS', 'year', 'reference']
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames).reset_index()[columns + [c for c in frames[0].columns if c not in columns]]
+
+
+def campaign_series(table, x_column, y_column, err_column=None, x_OFF=None, years=None):
+    """ Séries de render, uma por mistura e ano, para qualquer número de campanhas
+
+    O ano mais recente tem marcadores cheios e os anteriores vazios; x_OFF substitui ABS infinito (fonte desligada).
+    """
+    years = sorted(table['year'].unique(), reverse=True) if years is None else years
+    series = []
+    for k, year in enumerate(years):
+        for mixture, group in table[table['year'] == year].groupby('mixture', sort=False):
+            x = group[x_column].to_numpy(dtype=float)
+            if x_OFF is not None:
+                x = np.where(np.isinf(x), x_OFF, x)
+            one = {'x': x, 'y': group[y_column].to_numpy(dtype=float),
+                   'style': mixture_style(mixture, filled=(k == 0)), 'label': f"{mixture} {year}"}
+            if err_column is not None:
+                one['y_low'] = group[err_column].to_numpy(dtype=float)
+            series.append(one)
+    return series
+
+
+def delta_spec(comparison, quantity='Emax', x_OFF=25, output=None):
+    """ delta(grandeza) vs ABS, uma série por mistura e ano comparado """
+    reference = comparison['reference'].iloc[0] if len(comparison) else ""
+    series = campaign_series(comparison, 'ABS', f"delta_{quantity}", f"delta_{quantity}_err", x_OFF)
+    zero = {'coords': (0.1, 0., x_OFF + 1, 0.), 'color': 1, 'style': 9, 'width': 2}
+    return plot_spec('Emax_vs_bkg', title=f"Delta {quantity} vs ABS", series=series, lines=[zero],
+                     x_title="ABS", y_title=f"#Delta{quantity} (ano - {reference})",
+                     legend={'box': (0.13, 0.65, 0.35, 0.89), 'text_size': 0.025, 'fill_style': 0},
+                     outputs=[output or f"delta_{quantity}_vs_ABS.png"])
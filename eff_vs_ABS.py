@@ -1,195 +1,47 @@
-import os
-import pandas as pd
+import argparse
 import numpy as np
-import ROOT
-import math
+from render import mixture_labels, mixture_series, plot_spec, render
+from pipeline import ABS_OFF_plot, mixtures, build_fit_table, campaign_years, table_stage, table_to_dicts
 
-markers = [20, 21, 22, 23, 24]  
-colors = [ROOT.kBlue, ROOT.kRed, ROOT.kGreen+2, ROOT.kMagenta, ROOT.kOrange+7]
-
-def get_files(data_folder):
-    mixtures = ['STDMX', '30CO2', '30CO205SF6', '40CO2']
-    
-    num_files = {
-        "STDMX": ["STDMX_OFF.csv", "STDMX_22.csv", "STDMX_10.csv", "STDMX_6.9.csv", "STDMX_3.3.csv", "STDMX_2.2.csv", "STDMX_1.csv"],
-        "30CO2": ["30CO2_OFF.csv", "30CO2_22.csv", "30CO2_10.csv", "30CO2_6.9.csv", "30CO2_3.3.csv", "30CO2_2.2.csv", "30CO2_1.csv"],
-        "30CO205SF6": ["30CO205SF6_OFF.csv", "30CO205SF6_22.csv", "30CO205SF6_10.csv", "30CO205SF6_6.9.csv", "30CO205SF6_3.3.csv", "30CO205SF6_2.2.csv", "30CO205SF6_1.csv"],
-        "40CO2": ["40CO2_OFF.csv", "40CO2_22.csv", "40CO2_10.csv", "40CO2_6.9.csv", "40CO2_3.3.csv"]
-    }
-    
-    csv_files_2024 = {mixture: [] for mixture in mixtures}
-
-    for mixture in mixtures:
-        for file_name in num_files[mixture]:
-            full_path = os.path.join(data_folder, file_name)
-            csv_files_2024[mixture].append(full_path)
-    
-    return csv_files_2024
-
-def create_eff_graph(df, index):
-    gr = ROOT.TGraphErrors(len(df),
-                           np.array(df['HV_top'].values, dtype=float), 
-                           np.array(df['efficiency'].values, dtype=float),
-                           ROOT.nullptr, 
-                           np.array(df['eff_error'].values, dtype=float))
-    gr.SetMarkerStyle(index % 10 + 20)
-    gr.SetMarkerColor(index + 1)
-    gr.SetLineColor(index + 1)
-    return gr
-
-def fit_sigmoid(graph, df, index):
-    sigmoid = ROOT.TF1(f"sigmoid_{index}", "[0]/(1+ TMath::Exp(-[1]*(x-[2])))", df['HV_top'].min(), df['HV_top'].max())
-    sigmoid.SetParNames("Emax", "Lambda", "HV50")
-    sigmoid.SetParameters(0.9, 0.01, 7000)
-    sigmoid.SetLineColor(index + 1)
-    graph.Fit(sigmoid, "R")
-    return sigmoid
-
-def extract_fit_parameters(fits, HV_ref=9500):
-    params = []
-    for sigmoid in fits:
-        Emax = sigmoid.GetParameter(0)
-        Lambda = sigmoid.GetParameter(1)
-        HV50 = sigmoid.GetParameter(2)
-        HV95 = sigmoid.GetX(HV_ref)
-        WP = HV50 - math.log(1 / 0.95 - 1) / Lambda + 150.
-        params.append({'Emax': Emax, 'Lambda': Lambda, 'HV50': HV50, 'HV95': HV95, 'WP': WP})
-    return params
-
-def process_files(csv_files):
-    graphs, fits = [], []
-    for i, file in enumerate(csv_files):
-        df = pd.read_csv(file)
-        gr = create_eff_graph(df, i)
-        sigmoid = fit_sigmoid(gr, df, i)
-        graphs.append(gr)
-        fits.append(sigmoid)
-    return fits
-
-def extract_ABS_Emax(params, csv_files):
-    Emax = {mixture: [p['Emax'] for p in param_list] for mixture, param_list in params.items()}
-    ABS = {mixture: [] for mixture in csv_files.keys()}
-    for mixture, files in csv_files.items():
-        for file in files:
-            try:
-                value = file.split("/")[-1].split("_", 1)[1].replace(".csv", "")
-                ABS[mixture].append(25 if value == "OFF" else float(value))
-            except (IndexError, ValueError):
-                ABS[mixture].append(0)
-    print(Emax, ABS)
+def extract_ABS_Emax(table, year):
+    Emax = table_to_dicts(table, year, 'Emax')
+    ABS = table_to_dicts(table.assign(ABS=table['ABS'].replace(np.inf, ABS_OFF_plot)), year, 'ABS')
     return Emax, ABS
 
-def plot_ABS_vs_Emax(Emax_2024, Emax_2023, ABS_2024, ABS_2023):
-    # Criando o gráfico de 2024 com preenchimento
-    gr_2024_STDMX = ROOT.TGraph(len(ABS_2024['STDMX']), np.array(ABS_2024['STDMX'], dtype=float), np.array(Emax_2024['STDMX'], dtype=float))
-    gr_2024_30CO2 = ROOT.TGraph(len(ABS_2024['30CO2']), np.array(ABS_2024['30CO2'], dtype=float), np.array(Emax_2024['30CO2'], dtype=float))
-    gr_2024_30CO205SF6 = ROOT.TGraph(len(ABS_2024['30CO205SF6']), np.array(ABS_2024['30CO205SF6'], dtype=float), np.array(Emax_2024['30CO205SF6'], dtype=float))
-    gr_2024_40CO2 = ROOT.TGraph(len(ABS_2024['40CO2']), np.array(ABS_2024['40CO2'], dtype=float), np.array(Emax_2024['40CO2'], dtype=float))
-
-    gr_2024_STDMX.SetMarkerStyle(20)
-    gr_2024_STDMX.SetMarkerColor(ROOT.kBlack)
-    gr_2024_STDMX.SetMarkerSize(1.2)
-    gr_2024_STDMX.SetFillColor(ROOT.kBlack)
-    
-    gr_2024_30CO2.SetMarkerStyle(21)
-    gr_2024_30CO2.SetMarkerColor(ROOT.kRed)
-    gr_2024_30CO2.SetMarkerSize(1.2)
-    gr_2024_30CO2.SetFillColor(ROOT.kRed)
-    
-    gr_2024_30CO205SF6.SetMarkerStyle(22)
-    gr_2024_30CO205SF6.SetMarkerColor(ROOT.kBlue)
-    gr_2024_30CO205SF6.SetMarkerSize(1.2)
-    gr_2024_30CO205SF6.SetFillColor(ROOT.kBlue)
-    
-    gr_2024_40CO2.SetMarkerStyle(23)
-    gr_2024_40CO2.SetMarkerColor(ROOT.kGreen+2)
-    gr_2024_40CO2.SetMarkerSize(1.2)
-    gr_2024_40CO2.SetFillColor(ROOT.kGreen+2)
-    
-    # Criando o gráfico de 2023 sem preenchimento
-    gr_2023_STDMX = ROOT.TGraph(len(ABS_2023['STDMX']), np.array(ABS_2023['STDMX'], dtype=float), np.array(Emax_2023['STDMX'], dtype=float))
-    gr_2023_30CO2 = ROOT.TGraph(len(ABS_2023['30CO2']), np.array(ABS_2023['30CO2'], dtype=float), np.array(Emax_2023['30CO2'], dtype=float))
-    gr_2023_30CO205SF6 = ROOT.TGraph(len(ABS_2023['30CO205SF6']), np.array(ABS_2023['30CO205SF6'], dtype=float), np.array(Emax_2023['30CO205SF6'], dtype=float))
-    gr_2023_40CO2 = ROOT.TGraph(len(ABS_2023['40CO2']), np.array(ABS_2023['40CO2'], dtype=float), np.array(Emax_2023['40CO2'], dtype=float))
-
-    gr_2023_STDMX.SetMarkerStyle(24)
-    gr_2023_STDMX.SetMarkerColor(ROOT.kBlack)
-    gr_2023_STDMX.SetMarkerSize(1.2)
-    
-    gr_2023_30CO2.SetMarkerStyle(25)
-    gr_2023_30CO2.SetMarkerColor(ROOT.kRed)
-    gr_2023_30CO2.SetMarkerSize(1.2)
-    
-    gr_2023_30CO205SF6.SetMarkerStyle(26)
-    gr_2023_30CO205SF6.SetMarkerColor(ROOT.kBlue)
-    gr_2023_30CO205SF6.SetMarkerSize(1.2)
-    
-    gr_2023_40CO2.SetMarkerStyle(32)
-    gr_2023_40CO2.SetMarkerColor(ROOT.kGreen+2)
-    gr_2023_40CO2.SetMarkerSize(1.2)
-
-    graphs = [gr_2024_STDMX, gr_2024_30CO2, gr_2024_30CO205SF6, gr_2024_40CO2, gr_2023_STDMX, gr_2023_30CO2, gr_2023_30CO205SF6, gr_2023_40CO2]
-    
-    # Criando o Canvas
-    c1 = ROOT.TCanvas("c1", "Emax vs ABS", 700, 600)    
-    mg = ROOT.TMultiGraph()
-    for gr in graphs:
-        mg.Add(gr)
-
-    mg.GetYaxis().SetRangeUser(0.8, 1.08)
-    mg.Draw("AP")
-    '''
-    gr_2024_STDMX.Draw("AP")
-    gr_2024_30CO2.Draw("P SAME")
-    gr_2024_30CO205SF6.Draw("P SAME")
-    gr_2024_40CO2.Draw("P SAME")
-    
-    gr_2023_STDMX.Draw("P SAME")
-    gr_2023_30CO2.Draw("P SAME")
-    gr_2023_30CO205SF6.Draw("P SAME")
-    gr_2023_40CO2.Draw("P SAME")
-    '''
-    
-    legend = ROOT.TLegend(0.13, 0.68, 0.25, 0.89)
-    legend.AddEntry(gr_2023_STDMX, "95.2% C_{2}H_{2}F_{4} + 4.5% iC_{4}H_{10} + 0.3% SF_{6}", "p")  
-    legend.AddEntry(gr_2023_30CO2, "64% C_{2}H_{2}F_{4} + 30% CO_{2} + 5% iC_{4}H_{10} + 1% SF_{6}", "p")  
-    legend.AddEntry(gr_2023_30CO205SF6, "64.5% C_{2}H_{2}F_{4} + 30% CO_{2} + 5% iC_{4}H_{10} + 0.5% SF_{6}", "p")  
-    legend.AddEntry(gr_2023_40CO2, "54% C_{2}H_{2}F_{4} + 40% CO_{2} + 5% iC_{4}H_{10} + 1% SF_{6}", "p")  
-    
-    legend.SetBorderSize(0)  # Remove a borda da legenda
-    legend.SetFillStyle(0)   # Remove o fundo da legenda para transparência
-    legend.SetTextSize(0.03) # Ajusta o tamanho do texto
-    legend.Draw("P SAME")
-
-    line = ROOT.TLine(0.1, 1., 26, 1.)
-    line.SetLineColor(1)
-    line.SetLineStyle(9)
-    line.SetLineWidth(2)
-    line.Draw("P SAME")
-    
-    c1.SaveAs("Emax_vs_ABS_2024_vs_2023.png")
+def ABS_vs_Emax_spec(Emax, ABS, errors=None, output=None):
+    # Emax, ABS, errors: {ano: {mistura: valores}}. O ano mais recente com preenchimento,
+    # os anteriores sem; a legenda usa os marcadores do mais antigo
+    years = sorted(Emax, reverse=True)
+    errors = errors or {}
+    series = []
+    for k, year in enumerate(years):
+        for mixture in mixtures:
+            one = mixture_series(ABS[year], Emax[year], errors.get(year), mixture, filled=(k == 0))
+            if year == years[-1]:
+                one['label'] = mixture_labels[mixture]
+            series.append(one)
+    output = output or f"Emax_vs_ABS_{'_vs_'.join(map(str, years))}.png"
+    return plot_spec('Emax_vs_ABS', series=series, outputs=[output])
+
+def plot_ABS_vs_Emax(Emax, ABS, errors=None):
+    render(ABS_vs_Emax_spec(Emax, ABS, errors))
     
 def main():
-    data_folder_2024 = "data_2024"
-    data_folder_2023 = "data_2023"
-    
-    csv_files_2024 = get_files(data_folder_2024)
-    csv_files_2023 = get_files(data_folder_2023)
+    parser = argparse.ArgumentParser(description="Emax vs ABS de todas as campanhas")
+    parser.add_argument("--no-plot", action="store_true", help="só ajusta e imprime as tabelas, sem importar o ROOT")
+    args = parser.parse_args()
 
-    params_2024, params_2023 = {}, {}
-    
-    for mixture, files in csv_files_2024.items():
-        fits = process_files(files)
-        params_2024[mixture] = extract_fit_parameters(fits)
+    table, fits, scans = build_fit_table()
+    if args.no_plot:
+        table_stage(table, fits, scans)
+        return
 
-    for mixture, files in csv_files_2023.items():
-        fits = process_files(files)
-        params_2023[mixture] = extract_fit_parameters(fits)
-    
-    Emax_2024, ABS_2024 = extract_ABS_Emax(params_2024, csv_files_2024)
-    Emax_2023, ABS_2023 = extract_ABS_Emax(params_2023, csv_files_2023)
+    years = campaign_years(table)
+    Emax, ABS = {}, {}
+    for year in years:
+        Emax[year], ABS[year] = extract_ABS_Emax(table, year)
     
-    plot_ABS_vs_Emax(Emax_2024, Emax_2023, ABS_2024, ABS_2023)
+    plot_ABS_vs_Emax(Emax, ABS)
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
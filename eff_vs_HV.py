@@ -1,17 +1,29 @@
-import ROOT
+import argparse
+import glob
+import tomllib
 import pandas as pd
 import os
-import math
+import numpy as np
+from lazy_root import set_batch, kBlue, kRed, kGreen, kMagenta, kOrange, kCyan, kBlack
+from fit_cache import FitCache
+from prefetch import fit_streaming
+from sigmoid_fit import derive_working_points, take_fits
+from campaign_store import folder_year, read_scan_file
+from instrument import enable, fit_events, span
+from render import campaign_texts, mixture_labels, plot_spec, render, render_many, unit_line
+from wp_index import WP_entry
 
 # Configurações gerais
 data_folder = "data_2024" 
-HV_ref = 95  
-colors = [ROOT.kBlue, ROOT.kRed, ROOT.kGreen+2, ROOT.kMagenta, ROOT.kOrange, ROOT.kCyan, ROOT.kBlack]
+colors = [kBlue, kRed, kGreen+2, kMagenta, kOrange, kCyan, kBlack]
 markers = [20, 21, 22, 23, 24, 25, 26]
 
+def WP_file(file):
+    base_name, ext = os.path.splitext(file)
+    return f"{base_name}_WP{ext}"
+
 def get_file_list(num_files):
     csv_files = []
-    csv_WP_files = []
     for i in range(num_files):
         file_name = input(f"Digite o nome do arquivo {i+1} (ex: STDMX_1.csv): ")
         full_path = os.path.join(data_folder, file_name)
@@ -19,189 +31,189 @@ def get_file_list(num_files):
             print(f"Erro: Arquivo '{file_name}' não encontrado na pasta {data_folder}. Pulando...")
             continue
         csv_files.append(full_path)
-        base_name, ext = os.path.splitext(file_name)
-        csv_WP_files.append(os.path.join(data_folder, f"{base_name}_WP{ext}"))
-    return csv_files, csv_WP_files
-
-def create_graph(df, index):
-    gr = ROOT.TGraphErrors(len(df),
-                           df['HV_top'].values.astype(float), 
-                           df['efficiency'].values.astype(float),
-                           ROOT.nullptr,  
-                           df['eff_error'].values.astype(float))
-    gr.SetMarkerStyle(markers[index % len(markers)])
-    gr.SetMarkerColor(colors[index % len(colors)])
-    gr.SetLineColor(colors[index % len(colors)])
-    return gr
-
-def fit_sigmoid(graph, df, index):
-    sigmoid = ROOT.TF1(f"sigmoid_{index}", "[0]/(1+ TMath::Exp(-[1]*(x-[2])))", df['HV_top'].min(), df['HV_top'].max())
-    sigmoid.SetParNames("Emax", "Lambda", "HV50")
-    sigmoid.SetParameters(0.9, 0.01, 7000)
-    sigmoid.SetLineColor(colors[index % len(colors)])
-    graph.Fit(sigmoid, "R")
-    return sigmoid
-
-def extract_fit_parameters(fits):
-    Emax, Lambda, HV50, HV95, WP = [], [], [], [], []
-    for sigmoid in fits:
-        Emax.append(sigmoid.GetParameter(0))
-        Lambda.append(sigmoid.GetParameter(1))
-        HV50.append(sigmoid.GetParameter(2))
-        HV95.append(sigmoid.GetX(HV_ref))
-        WP.append(HV50[-1] - math.log(1 / 0.95 - 1) / Lambda[-1] + 150.)
-    return Emax, Lambda, HV50, HV95, WP
-
-
-def plot_legends(csv_WP_files, graphs, fits, Emax, WP):
-    mixture = [item.split("/")[-1].split("_")[0] for item in csv_WP_files]
-    print(mixture)
+    return csv_files
 
-    legend = ROOT.TLegend(0.12, 0.68, 0.3, 0.89)
-    legend.SetTextFont(42)
-    legend.SetBorderSize(0) 
-    legend.SetFillStyle(4000)
-    legend.SetFillColor(0)  
-    legend.SetTextSize(0.02376) 
-
-    if all(p == mixture[0] for p in mixture):
-        for i, file in enumerate(csv_WP_files):
-            if not os.path.isfile(file):
-                print(f"Erro: Arquivo WP '{file}' não encontrado. Pulando...")
-                continue
-            
-            df = pd.read_csv(file)
-            if not {'noiseGammaRate', 'gamma_CS'}.issubset(df.columns):
-                print(f"Erro: Colunas esperadas não encontradas em '{file}'. Pulando...")
+def expand_files(patterns, folder=data_folder):
+    """ Expande nomes e globs (ex: 'STDMX_*.csv', 'data_2023/30CO2_1*.csv') em arquivos de scan HV """
+    csv_files = []
+    for pattern in patterns:
+        if not os.path.dirname(pattern):
+            pattern = os.path.join(folder, pattern)
+        matches = sorted(glob.glob(pattern)) if any(c in pattern for c in "*?[") else [pattern]
+        if not matches:
+            print(f"Erro: Nenhum arquivo corresponde a '{pattern}'. Pulando...")
+        for file in matches:
+            if file.endswith("_WP.csv"):
                 continue
-            
-            txt = df['noiseGammaRate'][0] / (df['gamma_CS'][0] * 1000)
-            eff_text = f"plateau = {Emax[i]:.0%}, WP = {(WP[i]/1000):.2f} kV, bkg gamma rate = {txt:.1f} kHz/cm^{{2}}, Eff(WP) = {fits[i].Eval(WP[i]):.0%}"
-            
-            legend.AddEntry(graphs[i], eff_text, "p")
-    
-    else:
-        gas_mixtures = [
-            "Standard gas mixture",
-            "30% CO_{2} + 1.0% SF_{6}",
-            "30% CO_{2} + 0.5% SF_{6}",
-            "40% CO_{2} + 1.0% SF_{6}"
-        ]
-        
-        gas_index = 0
-        for i, file in enumerate(csv_WP_files):
             if not os.path.isfile(file):
-                print(f"Erro: Arquivo WP '{file}' não encontrado. Pulando...")
-                continue
-            
-            df = pd.read_csv(file)
-            if not {'noiseGammaRate', 'gamma_CS'}.issubset(df.columns):
-                print(f"Erro: Colunas esperadas não encontradas em '{file}'. Pulando...")
+                print(f"Erro: Arquivo '{file}' não encontrado. Pulando...")
                 continue
-            
-            txt = df['noiseGammaRate'][0] / (df['gamma_CS'][0] * 1000)
-            eff_text = f"plateau = {Emax[i]:.0%}, WP = {(WP[i]/1000):.2f} kV, {gas_mixtures[gas_index]}, Eff(WP) = {fits[i].Eval(WP[i]):.0%}"
-            gas_index = (gas_index + 1) % len(gas_mixtures)
-            
-            legend.AddEntry(graphs[i], eff_text, "p")
-
-    return legend, txt  
-
-
-def plot_heads():
-    cms_tex = ROOT.TLatex()
-    cms_tex.SetNDC()
-    cms_tex.SetTextFont(61)
-    cms_tex.SetTextSize(0.04)
-    cms_tex.DrawLatex(0.10, 0.905, "CMS MUON")
-
-    cms_tex_1 = ROOT.TLatex()
-    cms_tex_1.SetNDC()
-    cms_tex_1.SetTextFont(61)
-    cms_tex_1.SetTextSize(0.04)
-    cms_tex_1.DrawLatex(0.80, 0.905, "GIF++")
-
-    cms_tex_2 = ROOT.TLatex()
-    cms_tex_2.SetNDC()
-    cms_tex_2.SetTextFont(52)
-    cms_tex_2.SetTextSize(0.04)
-    cms_tex_2.DrawLatex(0.32, 0.905, "Preliminary")
-
-
-def plot_results(graphs, fits, legend, csv_WP_files, txt):
-    """ Cria e exibe o gráfico final """
-    c1 = ROOT.TCanvas("c1", "Efficiency vs HV_top with Fits", 630, 600)
+            if file not in csv_files:
+                csv_files.append(file)
+    return csv_files
+
+def load_config(path):
+    """ Lê os conjuntos de sobreposição de um arquivo TOML:
+
+        data_folder = "data_2024"
+        [[overlay]]
+        files = ["STDMX_*.csv"]
+        output = "eff_vs_HV_STDMX.pdf"
+    """
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+    folder = config.get('data_folder', data_folder)
+    return [{'files': expand_files(overlay['files'], overlay.get('data_folder', folder)),
+             'output': overlay.get('output', f"eff_vs_HV_{i}.pdf")}
+            for i, overlay in enumerate(config.get('overlay', []))]
+
+def scan_series(df, result, index):
+    # A sigmoide só guarda o resultado do ajuste vetorizado para o desenho
+    Emax, Lambda, HV50 = (float(p) for p in result['params'][index])
+    return {'x': np.asarray(df['HV_top'], dtype=float),
+            'y': np.asarray(df['efficiency'], dtype=float),
+            'y_low': np.asarray(df['eff_error'], dtype=float),
+            'style': {'marker': markers[index % len(markers)], 'color': colors[index % len(colors)]},
+            'sigmoid': (Emax, Lambda, HV50, float(df['HV_top'].min()), float(df['HV_top'].max()))}
+
+def extract_fit_parameters(result):
+    points = derive_working_points(result)
+    return (list(result['Emax']), list(result['Lambda']), list(points['HV50']),
+            list(points['HV95']), list(points['WP']))
+
+def print_fit_table(csv_files, result, Emax, Lambda, HV50, HV95, WP):
+    points = derive_working_points(result)
+    table = pd.DataFrame({'file': [os.path.basename(file) for file in csv_files],
+                          'Emax': Emax, 'Lambda': Lambda, 'HV50': HV50, 'HV95': HV95, 'WP': WP,
+                          'WP_err': points['WP_err'],
+                          'Eff(WP)': points['Eff_WP'], 'Eff(WP)_err': points['Eff_WP_err'],
+                          'chi2/ndf': result['chi2'] / np.maximum(result['ndf'], 1)})
+    print(table.to_string(index=False))
+
+
+def legend_labels(csv_WP_files, result, Emax, WP):
+    """ Texto da legenda de cada scan (None se o _WP faltar) e a taxa de background do último _WP lido """
+    points = derive_working_points(result)
     mixture = [item.split("/")[-1].split("_")[0] for item in csv_WP_files]
-    mg = ROOT.TMultiGraph()
-    for gr in graphs:
-        mg.Add(gr)
-
-    mg.GetYaxis().SetRangeUser(0, 1.4)
-    mg.GetXaxis().SetRangeUser(6000, 7400)
-    mg.GetXaxis().SetTitle("HV_{eff} [V]")
-    mg.GetYaxis().SetTitle("Efficiency")
-    mg.Draw("AP")
-
-    if all(p == mixture[0] for p in mixture):
-        
-        line = ROOT.TLine(6250, 1., 7400, 1.)
-        line.SetLineColor(1)
-        line.SetLineStyle(9)
-        line.SetLineWidth(2)
-        line.Draw()
-
-        ltx_data = ROOT.TLatex()
-        ltx_data.SetTextFont(42)
-        ltx_data.SetTextSize(0.025)
-        ltx_data.SetTextColor(1)
-        ltx_data.DrawLatex(6300, 0.88, "Standard gas mixture")
-        ltx_data.DrawLatex(6300, 0.81, "Test Beam in April 2024")
-        ltx_data.DrawLatex(6300, 0.74, "After irradiation")
-        ltx_data.DrawLatex(6300, 0.67, "1.4 mm double gap RPC")
-        ltx_data.DrawLatex(6300, 0.60, "Threshold = 60 [fC]")
-    
+    same_mixture = all(p == mixture[0] for p in mixture)
+
+    labels, txt = [None] * len(csv_WP_files), None
+    for i, file in enumerate(csv_WP_files):
+        entry = WP_entry(file)
+        if entry is None:
+            print(f"Erro: Arquivo WP '{file}' não encontrado. Pulando...")
+            continue
+        if np.isnan(entry['bkg']):
+            print(f"Erro: Colunas esperadas não encontradas em '{file}'. Pulando...")
+            continue
+
+        txt = entry['bkg']
+        if same_mixture:
+            detail = f"bkg gamma rate = {txt:.1f} kHz/cm^{{2}}"
+        else:
+            detail = mixture_labels.get(mixture[i], mixture[i])
+        labels[i] = f"plateau = {Emax[i]:.0%}, WP = {(WP[i]/1000):.2f} #pm {(points['WP_err'][i]/1000):.2f} kV, {detail}, Eff(WP) = {points['Eff_WP'][i]:.0%}"
+
+    return labels, txt
+
+
+def overlay_spec(dfs, result, csv_WP_files, output="eff_vs_HV_with_fits.pdf", year=None, mixture=None):
+    """ Gráfico (render.plot_spec) de eficiência vs HV com as sigmoides de um conjunto de scans
+
+    year, mixture: campanha e mistura do cabeçalho; por padrão saem dos arquivos quando todos têm a mesma.
+    """
+    Emax, Lambda, HV50, HV95, WP = extract_fit_parameters(result)
+    labels, txt = legend_labels(csv_WP_files, result, Emax, WP)
+    series = [dict(scan_series(df, result, i), label=labels[i]) for i, df in enumerate(dfs)]
+
+    mixtures = {item.split("/")[-1].split("_")[0] for item in csv_WP_files}
+    years = {folder_year(os.path.dirname(item)) for item in csv_WP_files}
+    if mixture is None and len(mixtures) == 1:
+        mixture = mixtures.pop()
+    if year is None and len(years) == 1:
+        year = years.pop()
+
+    if mixture is not None:
+        x_text, lines, first = 6300, [unit_line(6250, 7400)], mixture_labels.get(mixture, mixture)
     else:
-        line = ROOT.TLine(6000, 1., 7400, 1.)
-        line.SetLineColor(1)
-        line.SetLineStyle(9)
-        line.SetLineWidth(2)
-        line.Draw()
-
-        ltx_data = ROOT.TLatex()
-        ltx_data.SetTextFont(42)
-        ltx_data.SetTextSize(0.025)
-        ltx_data.SetTextColor(1)
-        ltx_data.DrawLatex(6100, 0.88, f"background rate = {txt:.1f} kHz/cm^{{2}}")
-        ltx_data.DrawLatex(6100, 0.81, "Test Beam in April 2024")
-        ltx_data.DrawLatex(6100, 0.74, "After irradiation")
-        ltx_data.DrawLatex(6100, 0.67, "1.4 mm double gap RPC")
-        ltx_data.DrawLatex(6100, 0.60, "Threshold = 60 [fC]")
-
-    legend.Draw()
-    plot_heads() 
-    c1.Draw()
-    c1.SaveAs("eff_vs_HV_with_fits.pdf")
+        x_text, lines = 6100, [unit_line(6000, 7400)]
+        first = f"background rate = {txt:.1f} kHz/cm^{{2}}" if txt is not None else None
+    campaign = campaign_texts.get(year, {})
+    header = [first, campaign.get('beam'), "After irradiation" if campaign.get('irradiated') else None,
+              "1.4 mm double gap RPC", "Threshold = 60 [fC]"]
+    texts = [(x_text, y, text) for y, text in zip([0.88, 0.81, 0.74, 0.67, 0.60],
+                                                  [text for text in header if text is not None])]
+    return plot_spec('eff_vs_HV', series=series, lines=lines, texts=texts, outputs=[output])
+
+
+def plot_overlay(dfs, result, csv_WP_files, output="eff_vs_HV_with_fits.pdf"):
+    render(overlay_spec(dfs, result, csv_WP_files, output))
 
 
 def main():
-    num_files = int(input("Quantos scans deseja analisar? "))
-    csv_files, csv_WP_files = get_file_list(num_files)
-    
-    graphs, fits = [], []
-    for i, file in enumerate(csv_files):
-        df = pd.read_csv(file)
-        if not {'HV_top', 'efficiency', 'eff_error'}.issubset(df.columns):
-            print(f"Erro: Colunas esperadas não encontradas em '{file}'. Pulando...")
+    parser = argparse.ArgumentParser(description="Eficiência vs HV com ajuste sigmoide")
+    parser.add_argument("files", nargs="*", help="arquivos ou globs dos scans (ex: 'data_2024/STDMX_*.csv')")
+    parser.add_argument("-c", "--config", help="arquivo TOML com vários conjuntos [[overlay]]")
+    parser.add_argument("-d", "--data-folder", default=data_folder, help="pasta usada para nomes sem diretório")
+    parser.add_argument("-o", "--output", default="eff_vs_HV_with_fits.pdf", help="saída do conjunto passado em 'files'")
+    parser.add_argument("--no-plot", action="store_true", help="só ajusta e imprime a tabela, sem importar o ROOT")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processos para desenhar os conjuntos (padrão: todos os núcleos)")
+    parser.add_argument("--formats", nargs="+", default=None, help="formatos de saída (ex: pdf png); padrão: extensão de cada saída")
+    parser.add_argument("--trace", default=None, help="grava tempos e diagnósticos dos ajustes (.json: Chrome trace; senão JSON lines)")
+    parser.add_argument("--reader", choices=["store", "csv"], default="store",
+                        help="lê pelo Parquet da campanha ou direto dos CSVs (útil em EOS/discos de rede)")
+    parser.add_argument("--prefetch", type=int, default=8, help="arquivos lidos antecipadamente durante os ajustes")
+    parser.add_argument("--no-fit-cache", action="store_true", help="reajusta todos os scans sem ler nem gravar o cache de ajustes")
+    args = parser.parse_args()
+    if args.trace:
+        enable(args.trace)
+
+    overlays = load_config(args.config) if args.config else []
+    if args.files:
+        overlays.append({'files': expand_files(args.files, args.data_folder), 'output': args.output})
+    batch = bool(overlays)
+    if batch:
+        set_batch(True)
+    else:
+        num_files = int(input("Quantos scans deseja analisar? "))
+        overlays.append({'files': get_file_list(num_files), 'output': args.output})
+
+    def accept(file, df):
+        if {'HV_top', 'efficiency', 'eff_error'}.issubset(df.columns):
+            return True
+        print(f"Erro: Colunas esperadas não encontradas em '{file}'. Pulando...")
+        for overlay in overlays:
+            overlay['files'] = [other for other in overlay['files'] if other != file]
+        return False
+
+    # Cada arquivo é lido e ajustado uma única vez, mesmo que apareça em vários conjuntos;
+    # os próximos arquivos são lidos enquanto o bloco atual é ajustado
+    unique_files = list(dict.fromkeys(file for overlay in overlays for file in overlay['files']))
+    if not unique_files:
+        parser.error("nenhum arquivo de scan para ajustar")
+    load = pd.read_csv if args.reader == "csv" else read_scan_file
+    cache = None if args.no_fit_cache else FitCache()
+    with span("fit", n_scans=len(unique_files)):
+        files, dfs, result = fit_streaming(unique_files, load, accept, depth=args.prefetch, cache=cache)
+    if cache is not None:
+        cache.save()
+    if not files:
+        parser.error("nenhum dos arquivos tem as colunas HV_top, efficiency e eff_error")
+    fit_events(result, files)
+    Emax, Lambda, HV50, HV95, WP = extract_fit_parameters(result)
+    print_fit_table(files, result, Emax, Lambda, HV50, HV95, WP)
+    if args.no_plot:
+        return
+
+    specs = []
+    for overlay in overlays:
+        if not overlay['files']:
             continue
-        
-        gr = create_graph(df, i)
-        graphs.append(gr)
-        fits.append(fit_sigmoid(gr, df, i))
-    
-    Emax, Lambda, HV50, HV95, WP = extract_fit_parameters(fits)
-    legend, txt = plot_legends(csv_WP_files, graphs, fits, Emax, WP)   
-    plot_heads()
-    plot_results(graphs, fits, legend, csv_WP_files, txt)
+        indices = [files.index(file) for file in overlay['files']]
+        specs.append(overlay_spec([dfs[i] for i in indices], take_fits(result, indices),
+                                  [WP_file(file) for file in overlay['files']], overlay['output']))
+    # No modo interativo o desenho fica neste processo, fora do modo batch
+    render_many(specs, args.workers if batch else 1, args.formats)
     
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,445 @@
+import argparse
+import json
+import os
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from campaign_store import build_store
+from extraction_cache import ExtractionCache, default_cache_file
+from hist_stats import backend, read_hist_means
+from instrument import enable, event, span
+from scan_catalog import ScanCatalog, default_catalog_file, scan_points
+
+# Versão importável das células de extract_data.ipynb
+
+sigma_factor = (6.2*10e-3)/1.5
+
+# Dicionários de Scans. Mude os scans conforme necessário.
+scans_2024 = {
+    'STDMX_OFF': ['6001'],
+    'STDMX_22':  ['6009'],
+    'STDMX_10':  ['6011'],
+    'STDMX_6.9': ['6007'],
+    'STDMX_3.3': ['6014'],
+    'STDMX_2.2': ['5999'],
+    'STDMX_1':   ['6005'],
+
+    '30CO205SF6_OFF': ['5981'],
+    '30CO205SF6_22':  ['5985'],
+    '30CO205SF6_10':  ['5979'],
+    '30CO205SF6_6.9': ['5975'],
+    '30CO205SF6_3.3': ['5977'],
+    '30CO205SF6_2.2': ['5987'],
+    '30CO205SF6_1':   ['5983'],
+
+    '30CO2_OFF':      ['6019'],
+    '30CO2_22':       ['6021'],
+    '30CO2_10':       ['6015'],
+    '30CO2_6.9':      ['6016'],
+    '30CO2_3.3':      ['6023'],
+    '30CO2_2.2':      ['6025'],
+    '30CO2_1':        ['6027'],
+
+    '40CO2_OFF':      ['5959'],
+    '40CO2_22':       ['5953'],
+    '40CO2_10':       ['5961'],
+    '40CO2_6.9':      ['5951'],
+    '40CO2_4.6':      ['5947'],
+    '40CO2_3.3':      ['5957'],
+    '40CO2_2.2':      ['5963'],
+    '40CO2_1':        ['5955']
+}
+
+#Scans no WP
+scans_WP_2024 = {
+    'STDMX_OFF':  ['6004'],
+    'STDMX_22':   ['6010'],
+    'STDMX_10':   ['6012'],
+    'STDMX_6.9':  ['6008'],
+    'STDMX_3.3':  ['6003'],
+    'STDMX_2.2':  ['6000'],
+    'STDMX_1':    ['6006'],
+
+    '30CO2_OFF':  ['6029'],
+    '30CO2_22':   ['6022'],
+    '30CO2_10':   ['6020'],
+    '30CO2_3.3':  ['6024'],
+    '30CO2_2.2':  ['6026'],
+    '30CO2_1':    ['6028'],
+
+    '30CO205SF6_OFF':  ['5982'],
+    '30CO205SF6_22':   ['5986'],
+    '30CO205SF6_10':   ['5980'],
+    '30CO205SF6_6.9':  ['5973'],
+    '30CO205SF6_3.3':  ['5978'],
+    '30CO205SF6_2.2':  ['5988'],
+    '30CO205SF6_1':    ['5984'],
+
+    '40CO2_OFF':  ['5960'],
+    '40CO2_22':   ['5954'],
+    '40CO2_10':   ['5962'],
+    '40CO2_6.9':  ['5952'],
+    '40CO2_4.6':  ['5948'],
+    '40CO2_3.3':  ['5958'],
+    '40CO2_2.2':  ['5964'],
+    '40CO2_1':    ['5956']
+}
+
+scans_2023 = {'30CO2_OFF': ['5627'],
+         '30CO2_22':  ['5659'],
+         '30CO2_10':  ['5675'],
+         '30CO2_6.9': ['5621'],
+         '30CO2_4.6': ['5623'],
+         '30CO2_3.3': ['5622', '5625'],
+         '30CO2_2.2': ['5827'],
+         '30CO2_1': ['5820'],
+         '30CO205SF6_OFF': ['5712'],
+         '30CO205SF6_22':  ['5706'],
+         '30CO205SF6_10':  ['5707'],
+         '30CO205SF6_6.9': ['5708'],
+         '30CO205SF6_4.6': ['5709'],
+         '30CO205SF6_3.3': ['5713'],
+         '30CO205SF6_2.2': ['5840'],
+         '30CO205SF6_1': ['5838'],
+         '40CO2_OFF': ['5612'],
+         '40CO2_22':  ['5615'],
+         '40CO2_10':  ['5614'],
+         '40CO2_6.9': ['5616'],
+         '40CO2_4.6': ['5613'],
+         '40CO2_3.3': ['5611'],
+         'STDMX_OFF': ['5809'],
+         'STDMX_22':  ['5632'],
+         'STDMX_10':  ['5631'],
+         'STDMX_6.9': ['5633'],
+         'STDMX_4.6': ['5630'],
+         'STDMX_3.3': ['5629'],
+         'STDMX_2.2': ['5805'],
+         'STDMX_1': ['5810']
+         }
+
+scans_WP_2023 = {'STDMX_OFF': ['5808'],
+         'STDMX_22':  ['5813'],
+         'STDMX_10':  ['5815'], #HV7
+         'STDMX_6.9': ['5811'], #HV7
+         'STDMX_4.6': ['5807'],
+         'STDMX_3.3': ['5814'],
+         'STDMX_2.2': ['5805'], #HV7
+         'STDMX_1': ['5810'], #HV7
+         '30CO2_OFF': ['5819'],
+         '30CO2_22':  ['5826'],
+         '30CO2_10':  ['5832'], #HV7
+         '30CO2_6.9': ['5830'], #HV7
+         '30CO2_4.6': ['5831'],
+         '30CO2_3.3': ['5822'],
+         '30CO2_2.2': ['5827'], #HV7
+         '30CO2_1': ['5820'], #HV7
+         '30CO205SF6_OFF': ['5833'],
+         '30CO205SF6_22':  ['5839'],
+         '30CO205SF6_10':  ['5836'],
+         '30CO205SF6_6.9': ['5837'],
+         '30CO205SF6_4.6': ['5835'],
+         '30CO205SF6_3.3': ['5834'],
+         '30CO205SF6_2.2': ['5838'], #HV7
+         '30CO205SF6_1': ['5840'],
+         '40CO2_OFF': ['5845'],
+         '40CO2_22':  ['5846'],
+         '40CO2_10':  ['5844'],
+         '40CO2_6.9': ['5843'],
+         '40CO2_4.6': ['5842'],
+         '40CO2_3.3': ['5841']
+         }
+
+campaigns = {
+    2023: {'folder': "Scans_2023", 'scans': scans_2023, 'wp_scans': scans_WP_2023},
+    2024: {'folder': "Scans_2024", 'scans': scans_2024, 'wp_scans': scans_WP_2024},
+}
+
+# Scans acrescentados durante a tomada de dados, sem editar os dicionários acima:
+# Scans_YYYY/scans.toml com tabelas [scans] e [wp_scans] no mesmo formato ("STDMX_OFF" = ["6001"])
+scan_map_name = "scans.toml"
+
+# Catálogo SQLite dos scans (scan_catalog); cada campanha é atualizada uma vez por processo
+catalog_options = {'path': default_catalog_file}
+_catalog = {'catalog': None, 'years': set()}
+
+# Particularidades de 2023 (ver notebook)
+skip_last_HV = {2023: {'5634', '5630'}}
+fixed_deltaV = {2023: {'5630'}}
+WP_HV_point = {2023: {'5810': 7, '5805': 7, '5820': 7, '5826': 7, '5830': 7, '5827': 7, '5815': 7, '5811': 7,
+                      '5841': 8, '5838': 8, '5840': 8}}
+
+json_keys = {
+    'muon_stream': 'muonStreamerProbability',
+    'gamma_stream': 'gammaStreamerProbability',
+    'muon_CM': 'muonCMP',
+    'gamma_CM': 'gammaCMP',
+    'muon_CS': 'muonCLS',
+    'gamma_CS': 'gammaCLS',
+    'muon_CM_err': 'muonCMP_err',
+    'gamma_CM_err': 'gammaCMP_err',
+    'muon_CS_err': 'muonCLS_err',
+    'gamma_CS_err': 'gammaCLS_err',
+    'efficiency': 'efficiencyMuon_corrected',
+    'eff_error': 'efficiencyMuon_corrected_err',
+    'noiseGammaRate': 'noiseGammaRate',
+    'noiseGammaRate_err': 'noiseGammaRate_err',
+}
+
+hist_names = {
+    'current_top': "Imon_KODELE-TOP",
+    'current_bot': "Imon_KODELE-BOT",
+    'HV_top': "HVeff_KODELE-TOP",
+    'HV_bot': "HVeff_KODELE-BOT",
+}
+
+HV_columns = ['HV_top', 'HV_bot', 'current_top', 'current_bot', 'muon_stream', 'gamma_stream',
+              'muon_CM', 'gamma_CM', 'muon_CS', 'gamma_CS', 'muon_CM_err', 'gamma_CM_err',
+              'muon_CS_err', 'gamma_CS_err', 'efficiency', 'eff_error', 'noiseGammaRate']
+
+WP_columns = ['current_top', 'current_bot', 'HV_top', 'HV_bot', 'muon_stream', 'gamma_stream',
+              'muon_CM', 'gamma_CM', 'muon_CS', 'gamma_CS', 'muon_CM_err', 'gamma_CM_err',
+              'muon_CS_err', 'gamma_CS_err', 'efficiency', 'eff_error', 'noiseGammaRate', 'noiseGammaRate_err']
+
+
+def scan_path(folder, scanId):
+    return os.path.join(folder, f"Scan_00{scanId}")
+
+
+def json_path(folder, scanId, HV):
+    return os.path.join(scan_path(folder, scanId), "ANALYSIS", "KODELE", f"HV{HV}", "output.json")
+
+
+def root_path(folder, scanId, HV):
+    return os.path.join(scan_path(folder, scanId), f"Scan00{scanId}_HV{HV}_CAEN.root")
+
+
+def campaign_scans(year):
+    """ (scans HV, scans WP) da campanha: os dicionários deste módulo mais o scans.toml da pasta, relido a cada chamada """
+    campaign = campaigns[year]
+    scans, wp_scans = dict(campaign['scans']), dict(campaign['wp_scans'])
+    path = os.path.join(campaign['folder'], scan_map_name)
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            extra = tomllib.load(f)
+        scans.update({name: [str(scanId) for scanId in scanIds] for name, scanIds in extra.get('scans', {}).items()})
+        wp_scans.update({name: [str(scanId) for scanId in scanIds] for name, scanIds in extra.get('wp_scans', {}).items()})
+    return scans, wp_scans
+
+
+def campaign_catalog(year):
+    """ Catálogo com os scans e as configurações da campanha já atualizados """
+    if _catalog['catalog'] is None:
+        _catalog['catalog'] = ScanCatalog(catalog_options['path'])
+    catalog = _catalog['catalog']
+    if year not in _catalog['years']:
+        campaign = campaigns[year]
+        n_new, n_changed, n_removed = catalog.refresh(campaign['folder'], year)
+        catalog.set_configs(year, *campaign_scans(year))
+        event("scan_catalog", year=year, new=n_new, changed=n_changed, removed=n_removed)
+        _catalog['years'].add(year)
+    return catalog
+
+
+def clear_catalog():
+    """ Força a releitura (incremental) dos diretórios de scan na próxima consulta """
+    _catalog['years'].clear()
+
+
+def count_HV_points(folder, scanId, year=None):
+    if year in campaigns and os.path.normpath(folder) == os.path.normpath(campaigns[year]['folder']):
+        N = campaign_catalog(year).HV_points(year, scanId)
+    else:
+        path = scan_path(folder, scanId)
+        N = len(scan_points(path)) if os.path.isdir(path) else 0
+    if str(scanId) in skip_last_HV.get(year, ()):
+        N -= 1
+    return N
+
+
+def read_HV_point(task):
+    """ Lê o output.json e as médias dos histogramas CAEN de um ponto HV """
+    folder, scanId, HV = task
+    path = json_path(folder, scanId, HV)
+    with open(path) as jsonFile:
+        parameters = json.load(jsonFile)
+    # Como no notebook, uma chave ausente é erro: um JSON truncado ou de outro formato não vira coluna nan
+    if 'output_parameters' not in parameters:
+        raise KeyError(f"{path} sem output_parameters")
+    output = parameters['output_parameters']
+    missing = [key for key in json_keys.values() if key not in output]
+    if missing:
+        raise KeyError(f"{path} sem {', '.join(missing)}")
+    row = {column: output[key] for column, key in json_keys.items()}
+
+    # Só as médias guardadas nos histogramas; com uproot, sem passar pelo PyROOT
+    means = read_hist_means(root_path(folder, scanId, HV), hist_names.values())
+    for column, name in hist_names.items():
+        row[column] = means[name]
+    return row
+
+
+def task_paths(task):
+    folder, scanId, HV = task
+    return json_path(folder, scanId, HV), root_path(folder, scanId, HV)
+
+
+def _read_point_or_error(task):
+    """ read_HV_point, devolvendo o erro em vez de lançá-lo: um ponto ruim não derruba as outras configurações """
+    try:
+        return read_HV_point(task)
+    except (OSError, KeyError, ValueError) as error:
+        return error
+
+
+def _read_points(tasks, workers):
+    if workers == 1 or len(tasks) <= 1:
+        return [_read_point_or_error(task) for task in tasks]
+    # executor.map preserva a ordem das tarefas: o resultado é determinístico
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_read_point_or_error, tasks, chunksize=max(1, len(tasks) // (4 * (workers or os.cpu_count())))))
+
+
+def _map_points(tasks, workers, cache=None):
+    if cache is None:
+        return _read_points(tasks, workers)
+    # Só os pontos novos ou modificados são relidos
+    rows = [cache.get(task_paths(task)) for task in tasks]
+    missing = [i for i, row in enumerate(rows) if row is None]
+    for i, row in zip(missing, _read_points([tasks[i] for i in missing], workers)):
+        rows[i] = row
+        if not isinstance(row, Exception):
+            cache.put(task_paths(tasks[i]), row)
+    cache.save()
+    return rows
+
+
+def HV_tasks(scanIds, year=2024):
+    folder = campaigns[year]['folder']
+    return [(folder, str(scanId), HV)
+            for scanId in scanIds
+            for HV in range(1, count_HV_points(folder, scanId, year) + 1)]
+
+
+def WP_task(scanId, year=2024):
+    return (campaigns[year]['folder'], str(scanId), WP_HV_point.get(year, {}).get(str(scanId), 1))
+
+
+def build_HV_dataframe(tasks, rows, year=2024):
+    DataSet = pd.DataFrame(rows, columns=HV_columns)
+    deltaV_top = DataSet['current_top'].values*1.5
+    deltaV_bot = DataSet['current_bot'].values*1.5
+    fixed = np.array([scanId in fixed_deltaV.get(year, ()) for _, scanId, _ in tasks], dtype=bool)
+    deltaV_top[fixed] = 0.001
+    deltaV_bot[fixed] = 0.001
+    DataSet['deltaV'] = (deltaV_top*deltaV_bot + 0.00000001)/(deltaV_top + deltaV_bot + 0.00000001)
+    DataSet['current'] = DataSet['current_top'] + DataSet['current_bot']
+    DataSet['deltaV_err'] = DataSet['deltaV']* sigma_factor *np.sqrt( (1 + (np.sqrt(DataSet['current_top']**2 + DataSet['current_bot']**2 ) / ( DataSet['current_top']+DataSet['current_bot']  ) )**2 ) )
+    return DataSet
+
+
+def build_WP_dataframe(rows):
+    DataSet = pd.DataFrame(rows, columns=WP_columns)
+    DataSet['efficiency'] = 100*DataSet['efficiency']
+    DataSet['current'] = DataSet['current_top'] + DataSet['current_bot']
+    return DataSet
+
+
+def HVCurrentDataFrame(scanIds, year=2024, workers=1, cache=None):
+    tasks = HV_tasks(scanIds, year)
+    return build_HV_dataframe(tasks, _map_points(tasks, workers, cache), year)
+
+
+def FeaturesDataFrame(scanIds, year=2024, workers=1, cache=None):
+    tasks = [WP_task(scanIds[scan][0], year) for scan in scanIds]
+    return build_WP_dataframe(_map_points(tasks, workers, cache))
+
+
+def campaign_jobs(year, names=None):
+    """ (arquivo CSV, tarefas) de cada configuração da campanha; 'names' limita a algumas configurações
+
+    Scans WP listados mas ainda não tomados (sem diretório) e configurações HV sem nenhum ponto ficam de fora.
+    """
+    scans, wp_scans = campaign_scans(year)
+    folder = campaigns[year]['folder']
+    jobs = [(f"{name}.csv", HV_tasks(scanIds, year)) for name, scanIds in scans.items()
+            if names is None or name in names]
+    jobs = [(filename, tasks) for filename, tasks in jobs if tasks]
+    for name, scanIds in wp_scans.items():
+        if names is not None and name not in names:
+            continue
+        if not os.path.isdir(scan_path(folder, scanIds[0])):
+            print(f"Aviso: scan WP {scanIds[0]} de {name} ainda não existe; {name}_WP.csv não será gravado")
+            continue
+        jobs.append((f"{name}_WP.csv", [WP_task(scanIds[0], year)]))
+    return jobs
+
+
+def export_jobs(jobs, year, output_folder, workers=None, cache=None, skip_failed=False):
+    """ Lê todas as tarefas num único pool, grava um CSV por job e atualiza o Parquet
+
+    Com skip_failed, um job com algum ponto ilegível (ex: ainda sendo escrito) é só avisado e
+    os demais são gravados; devolve os arquivos que falharam. Sem ele, o primeiro erro é lançado.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    all_tasks = [task for _, tasks in jobs for task in tasks]
+    with span("extract", n_points=len(all_tasks), n_files=len(jobs)):
+        all_rows = _map_points(all_tasks, workers, cache)
+    if cache is not None:
+        event("extraction_cache", hits=cache.hits, misses=cache.misses)
+        print(f"Cache: {cache.hits} pontos reaproveitados, {cache.misses} relidos")
+
+    start, failed = 0, []
+    for filename, tasks in jobs:
+        rows = all_rows[start:start + len(tasks)]
+        start += len(tasks)
+        errors = [row for row in rows if isinstance(row, Exception)]
+        if errors:
+            if not skip_failed:
+                raise errors[0]
+            print(f"Aviso: {filename} não foi extraído ({errors[0]})")
+            failed.append(filename)
+            continue
+        if filename.endswith("_WP.csv"):
+            df = build_WP_dataframe(rows)
+        else:
+            df = build_HV_dataframe(tasks, rows, year)
+        df.to_csv(os.path.join(output_folder, filename), index=False)
+        print(f"Arquivo salvo: {os.path.join(output_folder, filename)}")
+    build_store(output_folder, year)
+    return failed
+
+
+def export_campaign(year, output_folder=None, workers=None, cache=None):
+    """ Extrai todos os scans HV e WP de uma campanha num único pool de processos """
+    # Todas as (scan, ponto HV) de todas as configurações vão para o mesmo pool
+    export_jobs(campaign_jobs(year), year, output_folder or f"data_{year}", workers, cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extrai os CSVs de eficiência dos scans do GIF++")
+    parser.add_argument("years", nargs="*", type=int, help=f"campanhas entre {sorted(campaigns)} (padrão: 2024)")
+    parser.add_argument("-o", "--output", default=None, help="pasta de saída (padrão: data_<ano>)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="número de processos (padrão: todos os núcleos)")
+    parser.add_argument("--cache", default=default_cache_file, help="arquivo do cache de extração")
+    parser.add_argument("--cache-size", type=int, default=20000, help="número máximo de pontos HV no cache")
+    parser.add_argument("--no-cache", action="store_true", help="relê todos os arquivos ROOT/JSON")
+    parser.add_argument("--trace", default=None, help="grava os tempos de extração (.json: Chrome trace; senão JSON lines)")
+    parser.add_argument("--catalog", default=default_catalog_file, help="arquivo SQLite do catálogo de scans")
+    args = parser.parse_args()
+    if args.trace:
+        enable(args.trace)
+    if not set(args.years) <= set(campaigns):
+        parser.error(f"campanhas disponíveis: {sorted(campaigns)}")
+
+    catalog_options.update(path=args.catalog)
+    print(f"Leitura dos histogramas: {backend()}")
+    cache = None if args.no_cache else ExtractionCache(args.cache, args.cache_size)
+    for year in args.years or [2024]:
+        export_campaign(year, args.output, args.workers, cache)
+
+
+if __name__ == "__main__":
+    main()
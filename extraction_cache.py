@@ -0,0 +1,50 @@
+import json
+from collections import OrderedDict
+
+from persistent_cache import PersistentLRU, file_signature
+
+# Aumente quando read_HV_point mudar o conteúdo das linhas
+CACHE_VERSION = 2
+default_cache_file = ".extraction_cache.json"
+
+
+class ExtractionCache(PersistentLRU):
+    """ Cache persistente (LRU) das linhas extraídas de cada ponto HV """
+
+    def __init__(self, path=default_cache_file, max_entries=20000):
+        super().__init__(path, max_entries)
+
+    def _load(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        return OrderedDict(data['entries']) if data.get('version') == CACHE_VERSION else None
+
+    def _dump(self, tmp):
+        with open(tmp, "w") as f:
+            json.dump({'version': CACHE_VERSION, 'entries': list(self.entries.items())}, f)
+
+    @staticmethod
+    def key(paths):
+        return "|".join(paths)
+
+    def signature(self, paths):
+        try:
+            return [file_signature(path) for path in paths]
+        except OSError:
+            return None
+
+    def get(self, paths):
+        key = self.key(paths)
+        entry = self.entries.get(key)
+        if entry is not None and entry['signature'] == self.signature(paths):
+            self._touch(key)
+            self.hits += 1
+            return entry['row']
+        self.misses += 1
+        return None
+
+    def put(self, paths, row):
+        signature = self.signature(paths)
+        if signature is None:
+            return
+        self._store(self.key(paths), {'signature': signature, 'row': row})
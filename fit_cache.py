@@ -0,0 +1,137 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from persistent_cache import PersistentLRU
+from sigmoid_fit import fit_sigmoid_batch, fit_sigmoid_chains, take_fits
+
+# Cache persistente dos ajustes: cada scan é identificado pelo hash dos seus
+# pontos (HV, eficiência, erro), da configuração do ajuste e do ponto de partida; o resultado
+# (parâmetros, covariância, chi2, status) é guardado num .npz e reaproveitado
+# enquanto os dados e o modelo não mudarem.
+
+# Aumente quando o modelo (sigmoid), o initial_guess ou o critério de convergência mudarem
+FIT_CACHE_VERSION = 2
+default_fit_cache = ".fit_cache.npz"
+fit_fields = ('params', 'cov', 'chi2', 'ndf', 'status', 'niter')
+
+
+def fit_config(start, max_iter=200, tol=1e-10):
+    """ start: 'guess' (initial_guess de cada scan), 'chain' (warm start pelo scan anterior) ou 'p0' (explícito) """
+    return f"sigmoid|v{FIT_CACHE_VERSION}|start={start}|max_iter={max_iter}|tol={tol!r}".encode()
+
+
+def scan_keys(x, y, err, mask, config, p0=None):
+    """ Hash de cada scan empilhado: só os pontos válidos contam, então o preenchimento do stack não muda a chave
+
+    Com p0 explícito, o ponto de partida de cada scan também entra no hash.
+    """
+    keys = []
+    for i, (xs, ys, es, ms) in enumerate(zip(x, y, err, mask)):
+        h = hashlib.blake2b(config, digest_size=16)
+        for values in (xs[ms], ys[ms], es[ms]) + (() if p0 is None else (p0[i],)):
+            h.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        keys.append(h.hexdigest())
+    return keys
+
+
+def chain_keys(keys, chains):
+    """ Numa cadeia, a chave de cada scan inclui a do anterior: mudar um scan invalida os seguintes, que partem dele """
+    keys = list(keys)
+    for chain in chains:
+        for previous, current in zip(chain, chain[1:]):
+            keys[current] = hashlib.blake2b((keys[previous] + keys[current]).encode(), digest_size=16).hexdigest()
+    return keys
+
+
+class FitCache(PersistentLRU):
+    """ Resultados de ajuste por hash dos dados, gravados em .npz (LRU limitado a max_entries) """
+
+    label = "cache de ajustes"
+    # np.savez acrescenta .npz a nomes sem essa extensão
+    tmp_suffix = ".tmp.npz"
+
+    def __init__(self, path=default_fit_cache, max_entries=50000):
+        super().__init__(path, max_entries)
+
+    def _load(self, path):
+        with np.load(path) as data:
+            if int(data['version']) != FIT_CACHE_VERSION:
+                return None
+            fields = [data[name] for name in fit_fields]
+            return OrderedDict((key, tuple(field[i] for field in fields)) for i, key in enumerate(data['keys']))
+
+    def _dump(self, tmp):
+        rows = list(self.entries.values())
+        arrays = {name: np.array([row[k] for row in rows]) for k, name in enumerate(fit_fields)}
+        np.savez(tmp, version=FIT_CACHE_VERSION, keys=np.array(list(self.entries), dtype=str), **arrays)
+
+    def get(self, keys):
+        """ (índices encontrados, resultado parcial só com eles) """
+        found = [i for i, key in enumerate(keys) if key in self.entries]
+        for i in found:
+            self._touch(keys[i])
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        rows = [self.entries[keys[i]] for i in found]
+        result = {name: np.array([row[k] for row in rows]) for k, name in enumerate(fit_fields)}
+        return np.array(found, dtype=int), result
+
+    def put(self, keys, result):
+        for i, key in enumerate(keys):
+            self._store(key, tuple(np.array(result[name][i]) for name in fit_fields))
+
+
+def clear_fit_cache(path=default_fit_cache):
+    """ Apaga o arquivo do cache de ajustes """
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+def cached_fit(x, y, err, mask, cache=None, chains=None, p0=None, max_iter=200, tol=1e-10):
+    """ fit_sigmoid_chains (com 'chains') ou fit_sigmoid_batch só para os scans que não estão no cache
+
+    Os scans encontrados vêm do cache; os demais são ajustados juntos e acrescentados a ele.
+    O resultado é o mesmo de um ajuste sem cache com o mesmo ponto de partida.
+    """
+    if chains is not None:
+        start = 'chain'
+    elif p0 is not None:
+        start = 'p0'
+        p0 = np.broadcast_to(np.asarray(p0, dtype=float), (x.shape[0], 3))
+    else:
+        start = 'guess'
+    if cache is None:
+        if chains is not None:
+            return fit_sigmoid_chains(x, y, err, mask, chains, max_iter, tol)
+        return fit_sigmoid_batch(x, y, err, mask, p0, max_iter, tol)
+
+    keys = scan_keys(x, y, err, mask, fit_config(start, max_iter, tol), p0)
+    if chains is not None:
+        keys = chain_keys(keys, chains)
+    found, cached = cache.get(keys)
+    missing = np.setdiff1d(np.arange(len(keys)), found)
+
+    if chains is not None:
+        # Os scans do cache não são reajustados, mas continuam sendo o ponto de partida do seguinte
+        result = fit_sigmoid_chains(x, y, err, mask, chains, max_iter, tol, (found, cached) if len(found) else None)
+        cache.put([keys[i] for i in missing], take_fits(result, missing))
+        return result
+
+    if len(found) == 0:
+        result = fit_sigmoid_batch(x, y, err, mask, p0, max_iter, tol)
+        cache.put(keys, result)
+        return result
+    result = {name: np.empty((len(keys),) + values.shape[1:], dtype=values.dtype) for name, values in cached.items()}
+    for name, values in cached.items():
+        result[name][found] = values
+    if len(missing):
+        new = fit_sigmoid_batch(x[missing], y[missing], err[missing], mask[missing],
+                                None if p0 is None else p0[missing], max_iter, tol)
+        cache.put([keys[i] for i in missing], new)
+        for name in fit_fields:
+            result[name][missing] = new[name]
+    result['Emax'], result['Lambda'], result['HV50'] = result['params'].T
+    return result
@@ -0,0 +1,85 @@
+import numpy as np
+
+from sigmoid_fit import FIT_INVALID, initial_guess, levenberg_marquardt, sigmoid, sigmoid_jacobian
+
+# Ajuste global de uma mistura: todos os scans (ABS) juntos, com Lambda comum
+# e Emax, HV50 polinômios na taxa de background r (kHz/cm2):
+#   Emax(r) = a0 + a1 r + ... ,  HV50(r) = b0 + b1 r + ...
+# Parâmetros: (a0..ad, b0..bd, Lambda).
+
+
+def rate_basis(rate, degree):
+    return np.vander(np.asarray(rate, dtype=float), degree + 1, increasing=True)
+
+
+def global_par_names(degree):
+    return ([f"Emax_{k}" for k in range(degree + 1)] + [f"HV50_{k}" for k in range(degree + 1)] + ["Lambda"])
+
+
+def scan_params(theta, basis):
+    """ (Emax, Lambda, HV50) de cada scan a partir dos parâmetros globais """
+    n = basis.shape[1]
+    return np.stack([basis @ theta[:n], np.full(len(basis), theta[-1]), basis @ theta[n:2 * n]], axis=1)
+
+
+def _residuals(x, y, w, theta, basis):
+    p = scan_params(theta, basis)
+    return (y - sigmoid(x, p[:, 0:1], p[:, 1:2], p[:, 2:3])) * w
+
+
+def _jacobian(x, w, theta, basis):
+    # Regra da cadeia: d/da_k = d/dEmax * r^k, d/db_k = d/dHV50 * r^k
+    Jp = sigmoid_jacobian(x, scan_params(theta, basis)) * w[..., None]
+    J = np.concatenate([Jp[..., 0:1] * basis[:, None, :], Jp[..., 2:3] * basis[:, None, :], Jp[..., 1:2]], axis=-1)
+    return J.reshape(-1, J.shape[-1])
+
+
+def fit_global(x, y, err, mask, rate, degree=1, max_iter=200, tol=1e-10):
+    """ Ajuste simultâneo (Levenberg-Marquardt) de todos os scans de uma mistura
+
+    x, y, err, mask: arrays empilhados (stack_scans); rate: taxa de background de cada scan.
+    Devolve params/cov globais, chi2, ndf, status, niter e os parâmetros por scan em 'scan_params'.
+    """
+    rate = np.asarray(rate, dtype=float)
+    basis = rate_basis(rate, degree)
+    n_par = 2 * (degree + 1) + 1
+    ndf = int(mask.sum()) - n_par
+    w = np.where(mask, 1. / err, 0.)
+
+    # Ponto de partida: estimativas por scan (initial_guess) ajustadas por polinômios em r
+    p0 = initial_guess(x, y, mask)
+    theta = np.concatenate([np.linalg.lstsq(basis, p0[:, 0], rcond=None)[0],
+                            np.linalg.lstsq(basis, p0[:, 2], rcond=None)[0],
+                            [np.median(p0[:, 1])]])
+
+    result = {'params': theta, 'cov': np.full((n_par, n_par), np.nan), 'chi2': np.nan, 'ndf': ndf,
+              'status': FIT_INVALID, 'niter': 0, 'degree': degree, 'rate': rate}
+    if ndf <= 0 or len(np.unique(rate)) <= degree:
+        result['scan_params'] = scan_params(theta, basis)
+        return result
+
+    # Um único problema para o Levenberg-Marquardt do sigmoid_fit: todos os pontos de todos os scans
+    p, chi2, status, niter = levenberg_marquardt(
+        lambda idx, p: _residuals(x, y, w, p[0], basis).reshape(1, -1),
+        lambda idx, p: _jacobian(x, w, p[0], basis)[None], theta[None], [True], max_iter, tol)
+    theta, chi2, status, niter = p[0], chi2[0], int(status[0]), int(niter[0])
+
+    J = _jacobian(x, w, theta, basis)
+    result.update(params=theta, cov=np.linalg.pinv(J.T @ J), chi2=chi2, status=status, niter=niter,
+                  scan_params=scan_params(theta, basis))
+    return result
+
+
+def predict(result, rate):
+    """ Emax e HV50 (com erros propagados) do ajuste global em taxas de background arbitrárias """
+    rate = np.atleast_1d(np.asarray(rate, dtype=float))
+    basis = rate_basis(rate, result['degree'])
+    n = basis.shape[1]
+    theta, cov = result['params'], result['cov']
+    zeros = np.zeros((len(basis), n))
+    grad_Emax = np.concatenate([basis, zeros, np.zeros((len(basis), 1))], axis=1)
+    grad_HV50 = np.concatenate([zeros, basis, np.zeros((len(basis), 1))], axis=1)
+    err = lambda grad: np.sqrt(np.einsum('ni,ij,nj->n', grad, cov, grad))
+    return {'rate': rate,
+            'Emax': basis @ theta[:n], 'Emax_err': err(grad_Emax),
+            'HV50': basis @ theta[n:2 * n], 'HV50_err': err(grad_HV50)}
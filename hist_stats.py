@@ -0,0 +1,98 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import uproot
+except ImportError:
+    uproot = None
+
+# Estatísticas (média, RMS, entradas) de histogramas TH1 lidas direto dos
+# somatórios guardados no arquivo (fTsumw, fTsumwx, fTsumwx2, fEntries).
+# Como no TH1::GetStats, os somatórios são refeitos pelo conteúdo dos bins
+# quando fTsumw == 0 com entradas ou quando o eixo tem intervalo (SetRange).
+# Com o uproot o arquivo é mapeado em memória e nada passa pelo cling;
+# sem ele, cai no PyROOT (TFile::Get + GetMean), como no notebook.
+
+stat_names = ('mean', 'rms', 'entries')
+# TAxis::kAxisRange: o eixo tem um intervalo definido (TAxis::SetRange)
+kAxisRange = 1 << 11
+
+
+def backend():
+    return "uproot" if uproot is not None else "ROOT"
+
+
+def stats_from_sums(sumw, sumwx, sumwx2, entries):
+    """ Mesmas contas de TH1::GetMean/GetRMS a partir dos somatórios """
+    if sumw == 0:
+        return {'mean': 0., 'rms': 0., 'entries': entries}
+    mean = sumwx / sumw
+    return {'mean': mean, 'rms': math.sqrt(abs(sumwx2 / sumw - mean * mean)), 'entries': entries}
+
+
+def stats_from_bins(contents, edges, first, last, entries):
+    """ Somatórios do TH1::GetStats refeitos pelos bins first..last (1 = primeiro bin, contents com under/overflow) """
+    sumw = sumwx = sumwx2 = 0.
+    for b in range(first, last + 1):
+        x = 0.5 * (edges[b - 1] + edges[b])
+        w = float(contents[b])
+        sumw += w
+        sumwx += w * x
+        sumwx2 += w * x * x
+    return stats_from_sums(sumw, sumwx, sumwx2, entries)
+
+
+def _uproot_stats(hist):
+    sumw, sumwx, sumwx2, entries = (float(hist.member(member))
+                                    for member in ('fTsumw', 'fTsumwx', 'fTsumwx2', 'fEntries'))
+    axis = hist.member('fXaxis')
+    ranged = bool(int(axis.member('@fBits')) & kAxisRange)
+    if (sumw == 0 and entries > 0) or ranged:
+        edges = hist.axis(0).edges()
+        first, last = (int(axis.member('fFirst')), int(axis.member('fLast'))) if ranged else (1, len(edges) - 1)
+        return stats_from_bins(hist.values(flow=True), edges, first, last, entries)
+    return stats_from_sums(sumw, sumwx, sumwx2, entries)
+
+
+def _read_uproot(path, names):
+    with uproot.open(path) as histFile:
+        return {name: _uproot_stats(histFile[name]) for name in names}
+
+
+def _read_ROOT(path, names):
+    import ROOT
+
+    stats = {}
+    histFile = ROOT.TFile.Open(path, "READ")
+    for name in names:
+        hist = histFile.Get(name)
+        stats[name] = {'mean': hist.GetMean(), 'rms': hist.GetRMS(), 'entries': hist.GetEntries()}
+    histFile.Close()
+    return stats
+
+
+def read_hist_stats(path, names):
+    """ {nome do histograma: {'mean', 'rms', 'entries'}} de um arquivo ROOT """
+    if uproot is not None:
+        return _read_uproot(path, names)
+    return _read_ROOT(path, names)
+
+
+def read_hist_means(path, names):
+    return {name: stats['mean'] for name, stats in read_hist_stats(path, names).items()}
+
+
+def _read_task(task):
+    return read_hist_stats(*task)
+
+
+def read_many(paths, names, workers=None):
+    """ Lê as estatísticas dos mesmos histogramas em vários arquivos, na ordem de 'paths' """
+    names = list(names)
+    tasks = [(path, names) for path in paths]
+    if workers == 1 or len(tasks) <= 1:
+        return [_read_task(task) for task in tasks]
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_read_task, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
@@ -0,0 +1,121 @@
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+# Instrumentação opcional: tempos por etapa e por arquivo, diagnósticos de
+# ajuste por scan. Desligada, span() devolve um contexto vazio e event() volta
+# na hora. Ligada com enable(arquivo) ou com a variável de ambiente CO2_TRACE:
+#   *.json  -> Chrome trace (chrome://tracing, Perfetto), gravado no fim
+#   outros  -> JSON lines, uma linha por registro, gravado na hora
+# Só o processo que chamou enable() é registrado; os workers dos pools não.
+
+trace_env = "CO2_TRACE"
+
+_sink = None
+_null = nullcontext()
+
+
+class _Sink:
+    def __init__(self, path):
+        self.path = path
+        self.chrome = path.endswith(".json")
+        self.events = []
+        self.file = None if self.chrome else open(path, "w", buffering=1)
+        self.t0 = time.perf_counter()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def now_us(self):
+        return (time.perf_counter() - self.t0) * 1e6
+
+    def write(self, record):
+        record.update(pid=self.pid, tid=threading.get_ident())
+        with self.lock:
+            if self.chrome:
+                self.events.append(record)
+            else:
+                self.file.write(json.dumps(record, default=_to_json) + "\n")
+
+    def close(self):
+        if self.chrome:
+            with open(self.path, "w") as f:
+                json.dump({'traceEvents': self.events, 'displayTimeUnit': "ms"}, f, default=_to_json)
+        else:
+            self.file.close()
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def enable(path):
+    """ Liga a instrumentação gravando em 'path' (.json = Chrome trace, senão JSON lines) """
+    global _sink
+    disable()
+    _sink = _Sink(path)
+
+
+def disable():
+    global _sink
+    if _sink is not None:
+        _sink.close()
+        print(f"Trace salvo: {_sink.path}")
+        _sink = None
+
+
+def enabled():
+    return _sink is not None
+
+
+@contextmanager
+def _span(name, args):
+    start = _sink.now_us()
+    try:
+        yield args
+    finally:
+        if _sink is not None:
+            _sink.write({'name': name, 'ph': "X", 'ts': start, 'dur': _sink.now_us() - start, 'args': args})
+
+
+def span(name, **args):
+    """ Mede o tempo de um bloco: with span("fit", n_scans=10): ... """
+    if _sink is None:
+        return _null
+    return _span(name, args)
+
+
+def event(name, **args):
+    """ Registro instantâneo (contadores, diagnósticos) """
+    if _sink is None:
+        return
+    _sink.write({'name': name, 'ph': "i", 's': "t", 'ts': _sink.now_us(), 'args': args})
+
+
+def fit_events(result, labels):
+    """ Um evento "fit_scan" por scan: status, chi2/ndf e iterações do ajuste vetorizado """
+    if _sink is None:
+        return
+    for i, label in enumerate(labels):
+        ndf = int(result['ndf'][i])
+        event("fit_scan", scan=label, status=int(result['status'][i]), chi2=float(result['chi2'][i]), ndf=ndf,
+              chi2_ndf=float(result['chi2'][i]) / ndf if ndf > 0 else None, niter=int(result['niter'][i]))
+
+
+def _forget_in_child():
+    global _sink
+    _sink = None
+
+
+atexit.register(disable)
+os.register_at_fork(after_in_child=_forget_in_child)
+# Processos criados por spawn herdam a variável de ambiente, mas não devem gravar o trace
+if os.environ.get(trace_env) and multiprocessing.parent_process() is None:
+    enable(os.environ[trace_env])
@@ -0,0 +1,53 @@
+import importlib
+
+import numpy as np
+
+# Cores do ROOT (Rtypes.h), para definir estilos sem importar o ROOT
+kWhite, kBlack = 0, 1
+kRed, kGreen, kBlue = 632, 416, 600
+kMagenta, kCyan, kOrange = 616, 432, 800
+
+_batch = False
+
+
+class _LazyROOT:
+    """ Importa o ROOT (e inicializa o cling) só no primeiro acesso a um atributo """
+    _module = None
+
+    def __getattr__(self, name):
+        if _LazyROOT._module is None:
+            module = importlib.import_module("ROOT")
+            if _batch:
+                module.gROOT.SetBatch(True)
+            _LazyROOT._module = module
+        return getattr(_LazyROOT._module, name)
+
+
+ROOT = _LazyROOT()
+
+
+def set_batch(batch=True):
+    global _batch
+    _batch = batch
+    if _LazyROOT._module is not None:
+        _LazyROOT._module.gROOT.SetBatch(batch)
+
+
+def is_loaded():
+    return _LazyROOT._module is not None
+
+
+def make_graph(x, y, y_low=None, y_high=None):
+    """ TGraph; TGraphErrors só com y_low (erro simétrico); TGraphAsymmErrors com y_low e y_high
+
+    Arrays float64 contíguos (ex: views do ScanArrays) vão direto para o construtor, sem cópia;
+    o TGraph copia os pontos para os seus próprios buffers.
+    """
+    as_double = lambda values: np.ascontiguousarray(values, dtype=np.float64)
+    x, y = as_double(x), as_double(y)
+    if y_low is None:
+        return ROOT.TGraph(len(x), x, y)
+    if y_high is None:
+        return ROOT.TGraphErrors(len(x), x, y, ROOT.nullptr, as_double(y_low))
+    zeros = np.zeros_like(x)
+    return ROOT.TGraphAsymmErrors(len(x), x, y, zeros, zeros, as_double(y_low), as_double(y_high))
@@ -0,0 +1,57 @@
+import os
+from collections import OrderedDict
+
+# Base comum dos caches em disco (extraction_cache, fit_cache): entradas num
+# OrderedDict usado como LRU limitado a max_entries, contadores de acertos e
+# gravação atômica (arquivo temporário + os.replace) só quando algo mudou.
+
+
+def file_signature(path):
+    """ (mtime em ns, tamanho) de um arquivo: muda quando ele é reescrito """
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+class PersistentLRU:
+    """ Entradas LRU gravadas num arquivo; as subclasses definem _load(path) e _dump(tmp) """
+
+    label = "cache"
+    tmp_suffix = ".tmp"
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        if path and os.path.isfile(path):
+            try:
+                # _load devolve None para arquivos de outra versão
+                self.entries = self._load(path) or OrderedDict()
+            except (OSError, ValueError, KeyError):
+                print(f"Aviso: {self.label} '{path}' ilegível, recomeçando do zero")
+
+    def _load(self, path):
+        raise NotImplementedError
+
+    def _dump(self, tmp):
+        raise NotImplementedError
+
+    def _touch(self, key):
+        self.entries.move_to_end(key)
+
+    def _store(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp = self.path + self.tmp_suffix
+        self._dump(tmp)
+        os.replace(tmp, self.path)
+        self.dirty = False
@@ -0,0 +1,331 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bootstrap import toy_intervals
+from compare import compare_campaigns, compare_quantities, delta_spec
+from fit_cache import FitCache, cached_fit, clear_fit_cache, default_fit_cache
+from campaign_store import ABS_label, clear_loaded, folder_year, read_scan_file
+from instrument import enable, fit_events, span
+from lazy_root import set_batch
+from global_fit import fit_global, global_par_names, predict
+from render import mixture_style, render, render_many
+from scan_arrays import ScanArrays
+from wp_index import bkg_rate, clear_wp_index
+from sigmoid_fit import (FIT_OK, PAR_NAMES, derive_working_points, fit_report,
+                         initial_guess, stack_scans, take_fits)
+
+# Pipeline único: cada scan é lido e ajustado uma vez, e todas as saídas
+# (Emax vs ABS, Emax vs bkg, sobreposições HV, tabelas) usam a mesma tabela de ajustes.
+
+campaign_folders = {2024: "data_2024", 2023: "data_2023"}
+# Ordem das misturas nas tabelas e gráficos; as configurações (mistura, ABS) vêm dos próprios dados
+mixtures = ['STDMX', '30CO2', '30CO205SF6', '40CO2']
+# Valor de ABS usado nos gráficos para a fonte desligada
+ABS_OFF_plot = 25
+# Processos e formatos usados pelas etapas que desenham vários gráficos (render.render_many)
+render_options = {'workers': None, 'formats': None}
+# Grau dos polinômios Emax(r), HV50(r) do ajuste global e taxas (kHz/cm2) em que o Emax é extrapolado
+global_options = {'degree': 1, 'rates': []}
+# Ano de referência da comparação entre campanhas (None: o mais antigo)
+compare_options = {'reference': None}
+
+
+def campaign_configs(arrays, year):
+    """ (mistura, ABS) dos scans HV de uma campanha: misturas na ordem de 'mixtures', ABS de OFF ao menor """
+    order = {mixture: i for i, mixture in enumerate(mixtures)}
+    configs = [(mixture, ABS) for mixture, ABS, _, _ in arrays.keys(year=year, scan_type='HV')]
+    return sorted(configs, key=lambda config: (order.get(config[0], len(order)), config[0], -config[1]))
+
+
+def campaign_years(table):
+    """ Anos da tabela de ajustes, do mais recente ao mais antigo """
+    return sorted((int(year) for year in table['year'].unique()), reverse=True)
+
+
+def extract_fit_parameters(fits):
+    points = derive_working_points(fits)
+    params = pd.DataFrame({'Emax': fits['Emax'], 'Lambda': fits['Lambda']})
+    for name in ('HV50', 'HV95', 'WP', 'Eff_WP', 'HV95_err', 'WP_err', 'Eff_WP_err'):
+        params[name] = points[name]
+    return params
+
+
+def read_bkg(WP_file):
+    """ Taxa de background (kHz/cm2) da primeira linha do arquivo _WP, pelo índice de WPs """
+    return bkg_rate(WP_file)
+
+
+def fit_columns(fits):
+    """ Colunas da tabela de ajustes derivadas de um resultado de fit_sigmoid_batch """
+    columns = extract_fit_parameters(fits)
+    for i, name in enumerate(PAR_NAMES):
+        columns[f"{name}_err"] = np.sqrt(fits['cov'][:, i, i])
+    for name in ('chi2', 'ndf', 'status', 'niter'):
+        columns[name] = fits[name]
+    return columns
+
+
+def build_fit_table(folders=campaign_folders, n_toys=0, workers=None, seed=0, fit_cache=default_fit_cache):
+    """ Lê todos os scans de todas as campanhas e ajusta todos de uma só vez
+
+    Com n_toys > 0, acrescenta os intervalos de toy MC (Emax_lo/Emax_hi, HV50_*, WP_*).
+    fit_cache: arquivo do cache de ajustes (fit_cache.FitCache); scans inalterados não são reajustados. None desliga.
+    """
+    # Os scans ficam em colunas contíguas (ScanArrays); scans[file] é uma view sem cópia
+    rows, scans, arrays = [], {}, ScanArrays()
+    for year, data_folder in folders.items():
+        arrays.add_campaign(data_folder, scan_type='HV')
+        # Todas as configurações presentes nos dados; campanhas não precisam ter as mesmas
+        for mixture, ABS in campaign_configs(arrays, folder_year(data_folder)):
+            key = (mixture, ABS, folder_year(data_folder), 'HV')
+            file = os.path.join(data_folder, f"{mixture}_{ABS_label(ABS)}.csv")
+            WP_file = os.path.join(data_folder, f"{mixture}_{ABS_label(ABS)}_WP.csv")
+            scans[file] = arrays.view(key)
+            rows.append({'year': year, 'mixture': mixture, 'ABS': ABS,
+                         'file': file, 'WP_file': WP_file, 'bkg': read_bkg(WP_file)})
+
+    table = pd.DataFrame(rows)
+    # Warm start: cada ABS parte do ajuste do ABS vizinho da mesma mistura e ano
+    chains = [list(group.index) for _, group in table.groupby(['year', 'mixture'], sort=False)]
+    stacked = stack_scans([scans[file] for file in table['file']])
+    cache = FitCache(fit_cache) if fit_cache else None
+    with span("fit", n_scans=len(table)):
+        fits = cached_fit(*stacked, cache, chains)
+    if cache is not None:
+        print(f"Cache de ajustes: {cache.hits} reaproveitados, {cache.misses} ajustados")
+        cache.save()
+    fit_events(fits, table['file'])
+    print(fit_report(fits))
+    table = pd.concat([table, fit_columns(fits)], axis=1)
+    if n_toys > 0:
+        with span("toys", n_scans=len(table), n_toys=n_toys):
+            table = pd.concat([table, toy_intervals(*stacked, fits['params'], n_toys, seed, workers)], axis=1)
+    return table, fits, scans
+
+
+def refit_files(table, fits, scans, files, fit_cache=default_fit_cache):
+    """ Relê e reajusta só as linhas cujos arquivos (scan ou _WP) estão em 'files'
+
+    table, fits e scans são atualizados no lugar; cada scan parte do seu ajuste anterior.
+    Os novos ajustes vão para o cache de ajustes. Devolve os índices das linhas alteradas.
+    """
+    clear_loaded()
+    clear_wp_index()
+    indices = table.index[table['file'].isin(files) | table['WP_file'].isin(files)].to_numpy()
+    if len(indices) == 0:
+        return indices
+    for file in table.loc[indices, 'file']:
+        scans[file] = read_scan_file(file)
+    table.loc[indices, 'bkg'] = [read_bkg(WP_file) for WP_file in table.loc[indices, 'WP_file']]
+
+    x, y, err, mask = stack_scans([scans[file] for file in table.loc[indices, 'file']])
+    ok = (fits['status'][indices] == FIT_OK)[:, None]
+    cache = FitCache(fit_cache) if fit_cache else None
+    with span("refit", n_scans=len(indices)):
+        new = cached_fit(x, y, err, mask, cache, p0=np.where(ok, fits['params'][indices], initial_guess(x, y, mask)))
+    fit_events(new, table.loc[indices, 'file'])
+    print(fit_report(new))
+    if cache is not None:
+        cache.save()
+    for name in fits:
+        fits[name][indices] = new[name]
+    columns = fit_columns(new)
+    for name in columns:
+        table.loc[indices, name] = columns[name].to_numpy()
+    return indices
+
+
+def global_fit_table(table, scans, degree=1):
+    """ Ajuste global (global_fit.fit_global) de cada mistura e ano, com os scans que têm taxa de background """
+    rows, results = [], {}
+    for (year, mixture), group in table.dropna(subset=['bkg']).groupby(['year', 'mixture'], sort=False):
+        stacked = stack_scans([scans[file] for file in group['file']])
+        with span("global_fit", year=year, mixture=mixture, n_scans=len(group)):
+            result = fit_global(*stacked, group['bkg'].to_numpy(), degree)
+        results[(year, mixture)] = result
+        row = {'year': year, 'mixture': mixture, 'n_scans': len(group)}
+        for i, name in enumerate(global_par_names(degree)):
+            row[name] = result['params'][i]
+            row[f"{name}_err"] = np.sqrt(result['cov'][i, i])
+        for name in ('chi2', 'ndf', 'status', 'niter'):
+            row[name] = result[name]
+        rows.append(row)
+    return pd.DataFrame(rows), results
+
+
+def table_to_dicts(table, year, column):
+    """ {mixture: [valores]} na ordem da tabela (ABS de OFF ao menor), como os scripts esperam """
+    selected = table[table['year'] == year]
+    return {mixture: list(selected.loc[selected['mixture'] == mixture, column]) for mixture in mixtures}
+
+
+def Emax_errors(table, year):
+    """ {mixture: (erro inferior, erro superior)} do Emax pelos toys, ou None sem toys """
+    if 'Emax_lo' not in table:
+        return None
+    low = table_to_dicts(table.assign(low=table['Emax'] - table['Emax_lo']), year, 'low')
+    high = table_to_dicts(table.assign(high=table['Emax_hi'] - table['Emax']), year, 'high')
+    return {mixture: (low[mixture], high[mixture]) for mixture in mixtures}
+
+
+def ABS_spec(table, years=None):
+    from eff_vs_ABS import ABS_vs_Emax_spec, extract_ABS_Emax
+
+    years = campaign_years(table) if years is None else years
+    Emax, ABS = zip(*(extract_ABS_Emax(table, year) for year in years))
+    return ABS_vs_Emax_spec(dict(zip(years, Emax)), dict(zip(years, ABS)),
+                            {year: Emax_errors(table, year) for year in years})
+
+
+def bkg_spec(table, years=None, output=None, errors=True):
+    from eff_vs_bkg import bkg_vs_Emax_spec, extract_bkg_Emax
+
+    years = campaign_years(table) if years is None else years
+    Emax, bkg = zip(*(extract_bkg_Emax(table, year) for year in years))
+    table = table.dropna(subset=['bkg'])
+    return bkg_vs_Emax_spec(dict(zip(years, Emax)), dict(zip(years, bkg)),
+                            {year: Emax_errors(table, year) for year in years} if errors else None, output)
+
+
+def HV_specs(table, fits, scans, by, name):
+    from eff_vs_HV import overlay_spec
+
+    specs = []
+    for key, group in table.groupby(by, sort=False):
+        indices = group.index.to_numpy()
+        # Cabeçalho com a campanha e a mistura do grupo (nenhuma se o grupo mistura várias)
+        year, mixture = (group[column].iloc[0] if group[column].nunique() == 1 else None
+                         for column in ('year', 'mixture'))
+        specs.append(overlay_spec([scans[file] for file in group['file']], take_fits(fits, indices),
+                                  list(group['WP_file']), name(*key), int(year) if year is not None else None,
+                                  mixture))
+    return specs
+
+
+def overlay_specs(table, fits, scans):
+    return HV_specs(table, fits, scans, ['year', 'mixture'],
+                    lambda year, mixture: f"eff_vs_HV_{mixture}_{year}.pdf")
+
+
+def scan_specs(table, fits, scans):
+    # Uma figura por scan: mistura x ABS x ano
+    return HV_specs(table.assign(ABS_label=table['ABS'].map(ABS_label)), fits, scans, ['year', 'mixture', 'ABS_label'],
+                    lambda year, mixture, ABS: f"eff_vs_HV_{mixture}_{ABS}_{year}.pdf")
+
+
+def ABS_stage(table, fits, scans):
+    render(ABS_spec(table))
+
+
+def bkg_stage(table, fits, scans):
+    render(bkg_spec(table))
+
+
+def HV_stage(table, fits, scans):
+    render_many(overlay_specs(table, fits, scans), **render_options)
+
+
+def scans_stage(table, fits, scans):
+    render_many(scan_specs(table, fits, scans), **render_options)
+
+
+def global_stage(table, fits, scans):
+    global_table, results = global_fit_table(table, scans, global_options['degree'])
+    print(global_table.to_string(index=False))
+    global_table.to_csv("global_fit.csv", index=False)
+    print("Arquivo salvo: global_fit.csv")
+
+    rates = np.linspace(0., 1.1 * table['bkg'].max(), 100)
+    latest = campaign_years(table)[0]
+    curves = []
+    for (year, mixture), result in results.items():
+        for rate, Emax, Emax_err in zip(*(predict(result, global_options['rates'])[name]
+                                          for name in ('rate', 'Emax', 'Emax_err'))):
+            print(f"{year} {mixture}: Emax({rate:g} kHz/cm2) = {Emax:.3f} +- {Emax_err:.3f}")
+        style = dict(mixture_style(mixture), line_style=1 if year == latest else 2, line_width=2)
+        curves.append({'x': rates, 'y': predict(result, rates)['Emax'], 'style': style, 'option': "L"})
+
+    spec = bkg_spec(table, output="Emax_vs_Bkg_global_fit.png", errors=False)
+    spec['series'] += curves
+    render(spec)
+
+
+def compare_stage(table, fits, scans):
+    comparison = compare_campaigns(table, compare_options['reference'])
+    print(comparison.to_string(index=False))
+    comparison.to_csv("comparison.csv", index=False)
+    print("Arquivo salvo: comparison.csv")
+    # Emax vs ABS de todas as campanhas já sai na etapa ABS
+    if len(comparison):
+        render_many([delta_spec(comparison, quantity, ABS_OFF_plot) for quantity in compare_quantities], **render_options)
+
+
+def table_stage(table, fits, scans):
+    print(table.drop(columns=['file', 'WP_file']).to_string(index=False))
+    table.to_csv("fit_table.csv", index=False)
+    print("Arquivo salvo: fit_table.csv")
+
+
+stages = {
+    'ABS': ABS_stage,
+    'bkg': bkg_stage,
+    'HV': HV_stage,
+    'scans': scans_stage,
+    'table': table_stage,
+    'global': global_stage,
+    'compare': compare_stage,
+}
+
+
+def run(stage_names, folders=campaign_folders, n_toys=0, workers=None, seed=0, fit_cache=default_fit_cache):
+    with span("build_fit_table"):
+        table, fits, scans = build_fit_table(folders, n_toys, workers, seed, fit_cache)
+    for name in stage_names:
+        with span(f"stage:{name}"):
+            stages[name](table, fits, scans)
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajusta todos os scans uma vez e gera as saídas pedidas")
+    parser.add_argument("stages", nargs="*", help=f"etapas entre {sorted(stages)} (padrão: ABS bkg)")
+    parser.add_argument("--toys", type=int, default=0, help="toys MC por scan para os intervalos de Emax/HV50/WP")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processos para os toys e os gráficos (padrão: todos os núcleos)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--formats", nargs="+", default=None, help="formatos dos gráficos das etapas HV e scans (ex: pdf png)")
+    parser.add_argument("--trace", default=None, help="grava tempos e diagnósticos dos ajustes (.json: Chrome trace; senão JSON lines)")
+    parser.add_argument("--degree", type=int, default=1, help="grau de Emax(r) e HV50(r) no ajuste global")
+    parser.add_argument("--rates", nargs="+", type=float, default=[], help="taxas (kHz/cm2) para extrapolar o Emax do ajuste global")
+    parser.add_argument("--years", nargs="+", type=int, default=sorted(campaign_folders, reverse=True),
+                        help="campanhas a ajustar (pasta data_<ano>)")
+    parser.add_argument("--reference", type=int, default=None, help="ano de referência da etapa compare (padrão: o mais antigo)")
+    parser.add_argument("--fit-cache", default=default_fit_cache, help="arquivo do cache de ajustes")
+    parser.add_argument("--no-fit-cache", action="store_true", help="reajusta todos os scans sem ler nem gravar o cache")
+    parser.add_argument("--clear-fit-cache", action="store_true", help="esquece os ajustes guardados e reajusta tudo")
+    args = parser.parse_args()
+    # Sem 'choices' no argparse: com nargs="*" ele recusa a lista vazia (nenhuma etapa pedida)
+    if not set(args.stages) <= set(stages):
+        parser.error(f"etapas disponíveis: {sorted(stages)}")
+    folders = {year: campaign_folders.get(year, f"data_{year}") for year in args.years}
+    missing = [folder for folder in folders.values() if not os.path.isdir(folder)]
+    if missing:
+        parser.error(f"pastas de dados não encontradas: {', '.join(missing)} (rode extract_data.py antes)")
+    if args.reference is not None and args.reference not in folders:
+        parser.error(f"ano de referência {args.reference} fora de --years {args.years}")
+    if args.clear_fit_cache:
+        clear_fit_cache(args.fit_cache)
+    global_options.update(degree=args.degree, rates=args.rates)
+    compare_options.update(reference=args.reference)
+    if args.trace:
+        enable(args.trace)
+    set_batch(True)
+    render_options.update(workers=args.workers, formats=args.formats)
+    run(args.stages or ['ABS', 'bkg'], folders, n_toys=args.toys, workers=args.workers, seed=args.seed,
+        fit_cache=None if args.no_fit_cache else args.fit_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import pandas as pd
+
+from instrument import span
+from fit_cache import cached_fit
+from sigmoid_fit import concat_fits, stack_scans
+
+# Leitura antecipada: enquanto um bloco de scans é ajustado, threads já leem
+# os próximos 'depth' arquivos. A fila é limitada (no máximo 'depth' leituras
+# pendentes), então a memória não cresce com o número de arquivos.
+
+
+def prefetch(items, load=pd.read_csv, depth=8, workers=4):
+    """ Gera (item, load(item)) na ordem de 'items', com até 'depth' leituras em andamento """
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, depth))) as executor:
+        pending = deque((item, executor.submit(load, item)) for item in islice(items, depth))
+        while pending:
+            item, future = pending.popleft()
+            # Uma leitura só é disparada quando outra é consumida: contrapressão
+            for following in islice(items, 1):
+                pending.append((following, executor.submit(load, following)))
+            yield item, future.result()
+
+
+def fit_streaming(files, load=pd.read_csv, accept=None, chunk_size=32, depth=8, workers=4, cache=None):
+    """ Lê e ajusta em blocos de chunk_size scans, sobrepondo a leitura dos próximos ao ajuste do atual
+
+    accept(file, df) -> bool descarta arquivos inválidos; cache (fit_cache.FitCache) evita reajustar
+    scans inalterados. Devolve (arquivos, dfs, resultado do ajuste).
+    """
+    kept, dfs, results, block = [], [], [], []
+    for file, df in prefetch(files, load, depth, workers):
+        if accept is not None and not accept(file, df):
+            continue
+        kept.append(file)
+        dfs.append(df)
+        block.append(df)
+        if len(block) == chunk_size:
+            with span("fit_block", n_scans=len(block)):
+                results.append(cached_fit(*stack_scans(block), cache))
+            block = []
+    if block:
+        with span("fit_block", n_scans=len(block)):
+            results.append(cached_fit(*stack_scans(block), cache))
+    return kept, dfs, concat_fits(results)
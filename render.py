@@ -0,0 +1,216 @@
+import copy
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from instrument import span
+from lazy_root import ROOT, is_loaded, make_graph, set_batch, kBlack, kRed, kBlue, kGreen
+
+# Renderização declarativa: cada gráfico é um dict (séries, estilo, cabeçalho, textos)
+# que pode ser desenhado aqui mesmo ou enviado a processos em modo batch.
+
+# Cor, marcador cheio (2024) e marcador vazio (2023) de cada mistura
+mixture_styles = {
+    'STDMX': (kBlack, 20, 24),
+    '30CO2': (kRed, 21, 25),
+    '30CO205SF6': (kBlue, 22, 26),
+    '40CO2': (kGreen+2, 23, 32),
+}
+mixture_labels = {
+    'STDMX': "95.2% C_{2}H_{2}F_{4} + 4.5% iC_{4}H_{10} + 0.3% SF_{6}",
+    '30CO2': "64% C_{2}H_{2}F_{4} + 30% CO_{2} + 5% iC_{4}H_{10} + 1% SF_{6}",
+    '30CO205SF6': "64.5% C_{2}H_{2}F_{4} + 30% CO_{2} + 5% iC_{4}H_{10} + 0.5% SF_{6}",
+    '40CO2': "54% C_{2}H_{2}F_{4} + 40% CO_{2} + 5% iC_{4}H_{10} + 1% SF_{6}",
+}
+# Texto de cada campanha nos gráficos de eficiência vs HV (o RPC foi irradiado entre 2023 e 2024)
+campaign_texts = {
+    2024: {'beam': "Test Beam in April 2024", 'irradiated': True},
+    2023: {'beam': "Test Beam 2023", 'irradiated': False},
+}
+
+# Cabeçalho CMS MUON / GIF++ (x, y em NDC, texto, fonte)
+heads = [
+    (0.10, 0.905, "CMS MUON", 61),
+    (0.80, 0.905, "GIF++", 61),
+    (0.32, 0.905, "Preliminary", 52),
+]
+
+
+def unit_line(x_min, x_max):
+    """ Linha tracejada de eficiência 1 """
+    return {'coords': (x_min, 1., x_max, 1.), 'color': 1, 'style': 9, 'width': 2}
+
+
+templates = {
+    'Emax_vs_ABS': {
+        'title': "Emax vs ABS", 'size': (700, 600), 'y_range': (0.8, 1.08),
+        'legend': {'box': (0.13, 0.68, 0.25, 0.89), 'text_size': 0.03, 'fill_style': 0},
+        'lines': [unit_line(0.1, 26)], 'heads': False,
+    },
+    'Emax_vs_bkg': {
+        'title': "Emax vs Bkg", 'size': (800, 600), 'grid': True, 'heads': False,
+    },
+    'eff_vs_HV': {
+        'title': "Efficiency vs HV_top with Fits", 'size': (630, 600),
+        'x_range': (6000, 7400), 'y_range': (0, 1.4), 'x_title': "HV_{eff} [V]", 'y_title': "Efficiency",
+        'legend': {'box': (0.12, 0.68, 0.3, 0.89), 'text_size': 0.02376, 'font': 42, 'fill_style': 4000},
+        'text_size': 0.025, 'heads': True,
+    },
+}
+
+
+def plot_spec(template, **fields):
+    """ Novo gráfico a partir de um modelo; 'fields' sobrescreve as chaves do modelo """
+    spec = copy.deepcopy(templates[template])
+    spec.update(fields)
+    return spec
+
+
+def mixture_style(mixture, filled=True, size=1.2):
+    color, filled_marker, open_marker = mixture_styles[mixture]
+    style = {'marker': filled_marker if filled else open_marker, 'color': color, 'size': size}
+    if filled:
+        style['fill'] = color
+    return style
+
+
+def mixture_series(x, y, errors, mixture, filled=True):
+    """ Série {mistura: valores} -> dict de série; com toys MC, barras de erro assimétricas """
+    series = {'x': x[mixture], 'y': y[mixture], 'style': mixture_style(mixture, filled)}
+    if errors is not None:
+        series['y_low'], series['y_high'] = errors[mixture]
+    return series
+
+
+def apply_style(obj, style):
+    obj.SetMarkerStyle(style.get('marker', 20))
+    obj.SetMarkerColor(style.get('color', kBlack))
+    obj.SetLineColor(style.get('color', kBlack))
+    if 'size' in style:
+        obj.SetMarkerSize(style['size'])
+    if 'fill' in style:
+        obj.SetFillColor(style['fill'])
+    if 'line_style' in style:
+        obj.SetLineStyle(style['line_style'])
+    if 'line_width' in style:
+        obj.SetLineWidth(style['line_width'])
+
+
+def series_graph(series, keep):
+    gr = make_graph(series['x'], series['y'], series.get('y_low'), series.get('y_high'))
+    apply_style(gr, series.get('style', {}))
+    if 'sigmoid' in series:
+        Emax, Lambda, HV50, x_min, x_max = series['sigmoid']
+        sigmoid = ROOT.TF1(f"sigmoid_{len(keep)}", "[0]/(1+ TMath::Exp(-[1]*(x-[2])))", x_min, x_max)
+        sigmoid.SetParNames("Emax", "Lambda", "HV50")
+        sigmoid.SetParameters(Emax, Lambda, HV50)
+        sigmoid.SetLineColor(series.get('style', {}).get('color', kBlack))
+        gr.GetListOfFunctions().Add(sigmoid)
+        keep.append(sigmoid)
+    keep.append(gr)
+    return gr
+
+
+def draw_heads(keep):
+    for x, y, text, font in heads:
+        tex = ROOT.TLatex()
+        tex.SetNDC()
+        tex.SetTextFont(font)
+        tex.SetTextSize(0.04)
+        tex.DrawLatex(x, y, text)
+        keep.append(tex)
+
+
+def render(spec):
+    """ Desenha um gráfico e salva em todos os arquivos de spec['outputs'] """
+    with span("render", outputs=spec['outputs']):
+        return _render(spec)
+
+
+def _render(spec):
+    keep = []
+    c1 = ROOT.TCanvas(spec.get('name', "c1"), spec.get('title', ""), *spec.get('size', (700, 600)))
+    if spec.get('grid'):
+        c1.SetGrid()
+
+    mg = ROOT.TMultiGraph()
+    graphs = [series_graph(series, keep) for series in spec['series']]
+    # 'option' da série (ex: "L" para curvas) vale só para aquele gráfico
+    for gr, series in zip(graphs, spec['series']):
+        mg.Add(gr, series.get('option', ""))
+    if 'y_range' in spec:
+        mg.GetYaxis().SetRangeUser(*spec['y_range'])
+    if 'x_range' in spec:
+        mg.GetXaxis().SetRangeUser(*spec['x_range'])
+    if 'x_title' in spec:
+        mg.GetXaxis().SetTitle(spec['x_title'])
+    if 'y_title' in spec:
+        mg.GetYaxis().SetTitle(spec['y_title'])
+    mg.Draw("AP")
+
+    for line_spec in spec.get('lines', []):
+        line = ROOT.TLine(*line_spec['coords'])
+        line.SetLineColor(line_spec.get('color', 1))
+        line.SetLineStyle(line_spec.get('style', 1))
+        line.SetLineWidth(line_spec.get('width', 1))
+        line.Draw()
+        keep.append(line)
+
+    if spec.get('texts'):
+        ltx_data = ROOT.TLatex()
+        ltx_data.SetTextFont(42)
+        ltx_data.SetTextSize(spec.get('text_size', 0.025))
+        ltx_data.SetTextColor(1)
+        for x, y, text in spec['texts']:
+            ltx_data.DrawLatex(x, y, text)
+        keep.append(ltx_data)
+
+    labelled = [(gr, series['label']) for gr, series in zip(graphs, spec['series']) if series.get('label')]
+    if 'legend' in spec and labelled:
+        legend_spec = spec['legend']
+        legend = ROOT.TLegend(*legend_spec['box'])
+        if 'font' in legend_spec:
+            legend.SetTextFont(legend_spec['font'])
+        legend.SetBorderSize(0)
+        legend.SetFillStyle(legend_spec.get('fill_style', 0))
+        legend.SetFillColor(0)
+        legend.SetTextSize(legend_spec.get('text_size', 0.03))
+        for gr, label in labelled:
+            legend.AddEntry(gr, label, "p")
+        legend.Draw()
+        keep.append(legend)
+
+    if spec.get('heads', True):
+        draw_heads(keep)
+
+    c1.Draw()
+    for output in spec['outputs']:
+        c1.SaveAs(output)
+    return spec['outputs']
+
+
+def with_formats(spec, formats):
+    """ Troca as extensões de saída do gráfico pelos formatos pedidos (ex: ['pdf', 'png']) """
+    bases = dict.fromkeys(os.path.splitext(output)[0] for output in spec['outputs'])
+    return dict(spec, outputs=[f"{base}.{fmt}" for base in bases for fmt in formats])
+
+
+def _render_batch(spec):
+    set_batch(True)
+    return render(spec)
+
+
+def render_many(specs, workers=None, formats=None):
+    """ Renderiza vários gráficos em processos separados, com o ROOT em modo batch
+
+    workers=1 desenha neste processo. Devolve a lista de arquivos escritos por gráfico.
+    """
+    if formats:
+        specs = [with_formats(spec, formats) for spec in specs]
+    if workers == 1 or len(specs) <= 1:
+        return [render(spec) for spec in specs]
+    # Com o ROOT já carregado aqui, fork copiaria o estado do cling: os workers partem do zero
+    context = multiprocessing.get_context("spawn") if is_loaded() else None
+    with span("render_many", n_plots=len(specs)):
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(specs)), mp_context=context) as executor:
+            return list(executor.map(_render_batch, specs))
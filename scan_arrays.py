@@ -0,0 +1,96 @@
+import numpy as np
+
+from campaign_store import csv_columns, load_campaign
+
+# Armazenamento compacto dos scans: uma coluna = um array numpy pré-alocado
+# (com capacidade que dobra), e um índice (mistura, ABS, ano, tipo) -> faixa
+# de linhas. Cada configuração é uma view sem cópia dessas colunas.
+
+value_columns = list(dict.fromkeys(csv_columns['HV'] + csv_columns['WP']))
+
+
+class ScanView:
+    """ Uma configuração: views das colunas, com a interface de leitura de um DataFrame (df['HV_top'], len(df)) """
+
+    def __init__(self, arrays, start, stop):
+        self.arrays = arrays
+        self.start = start
+        self.stop = stop
+
+    def __getitem__(self, column):
+        return self.arrays.columns[column][self.start:self.stop]
+
+    def __len__(self):
+        return self.stop - self.start
+
+    @property
+    def columns(self):
+        return [column for column in self.arrays.columns if not np.isnan(self[column]).all()]
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame({column: self[column] for column in self.columns})
+
+
+class ScanArrays:
+    """ Colunas float pré-alocadas de muitos scans, indexadas por (mistura, ABS, ano, tipo) """
+
+    def __init__(self, columns=value_columns, dtype=np.float64, capacity=1024):
+        self.dtype = np.dtype(dtype)
+        self.columns = {column: np.full(capacity, np.nan, dtype=self.dtype) for column in columns}
+        self.size = 0
+        self.index = {}
+
+    @property
+    def capacity(self):
+        return len(next(iter(self.columns.values())))
+
+    def reserve(self, n_rows):
+        """ Garante espaço para mais n_rows linhas; a capacidade dobra, então as realocações são raras """
+        needed = self.size + n_rows
+        if needed <= self.capacity:
+            return
+        capacity = max(needed, 2 * self.capacity)
+        for column, values in self.columns.items():
+            grown = np.full(capacity, np.nan, dtype=self.dtype)
+            grown[:self.size] = values[:self.size]
+            self.columns[column] = grown
+
+    def append(self, key, data):
+        """ Acrescenta uma configuração; data: {coluna: valores}, colunas ausentes ficam nan """
+        n_rows = len(next(iter(data.values())))
+        self.reserve(n_rows)
+        start, stop = self.size, self.size + n_rows
+        for column, values in data.items():
+            if column in self.columns:
+                self.columns[column][start:stop] = values
+        self.size = stop
+        self.index[key] = (start, stop)
+
+    def add_store(self, store):
+        """ Acrescenta um DataFrame do campaign_store (ordenado por configuração e ponto) de uma só vez """
+        store = store.sort_values(['year', 'mixture', 'scan_type', 'ABS', 'point'], kind='stable', ignore_index=True)
+        start = self.size
+        self.reserve(len(store))
+        for column in self.columns:
+            if column in store:
+                self.columns[column][start:start + len(store)] = store[column].to_numpy(dtype=self.dtype, na_value=np.nan)
+        self.size += len(store)
+        keys = ['mixture', 'ABS', 'year', 'scan_type']
+        for (mixture, ABS, year, scan_type), rows in store.groupby(keys, observed=True, sort=False).indices.items():
+            self.index[(mixture, float(ABS), int(year), scan_type)] = (start + rows[0], start + rows[-1] + 1)
+
+    def add_campaign(self, data_folder, mixtures=None, scan_type=None):
+        self.add_store(load_campaign(data_folder, mixtures=mixtures, scan_type=scan_type))
+
+    def view(self, key):
+        start, stop = self.index[key]
+        return ScanView(self, start, stop)
+
+    def keys(self, mixture=None, ABS=None, year=None, scan_type=None):
+        wanted = (mixture, ABS, year, scan_type)
+        return [key for key in self.index
+                if all(want is None or value == want for value, want in zip(key, wanted))]
+
+    def nbytes(self):
+        return sum(values.nbytes for values in self.columns.values())
@@ -0,0 +1,189 @@
+import argparse
+import fnmatch
+import os
+import re
+import sqlite3
+
+import pandas as pd
+
+from campaign_store import ABS_label, ABS_value
+from instrument import span
+
+# Catálogo dos scans em SQLite: uma varredura com os.scandir de Scans_YYYY/Scan_00XXXX
+# guarda os pontos HV (tamanho e mtime dos CAEN.root e output.json) e, a partir dos
+# dicionários de extract_data, a configuração de cada scan (mistura, ABS, WP).
+# Na atualização cada arquivo é comparado pela assinatura (tamanho, mtime), como
+# no ExtractionCache, e só os scans com algum arquivo diferente são regravados.
+
+default_catalog_file = ".scan_catalog.sqlite"
+CATALOG_VERSION = 2
+scan_dir_pattern = re.compile(r"Scan_00(\d+)$")
+point_pattern = re.compile(r"_HV(\d+)_CAEN\.root$")
+
+schema = """
+CREATE TABLE IF NOT EXISTS scans (
+    year INTEGER, scanId TEXT, path TEXT, mtime_ns INTEGER, n_points INTEGER, size INTEGER,
+    PRIMARY KEY (year, scanId));
+CREATE TABLE IF NOT EXISTS points (
+    year INTEGER, scanId TEXT, HV INTEGER, root_size INTEGER, root_mtime_ns INTEGER,
+    json_size INTEGER, json_mtime_ns INTEGER,
+    PRIMARY KEY (year, scanId, HV));
+CREATE TABLE IF NOT EXISTS configs (
+    year INTEGER, scanId TEXT, mixture TEXT, ABS REAL, WP INTEGER,
+    PRIMARY KEY (year, scanId, mixture, ABS, WP));
+CREATE INDEX IF NOT EXISTS configs_query ON configs (mixture, year, ABS);
+"""
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, None
+    return st.st_size, st.st_mtime_ns
+
+
+def scan_points(path):
+    """ Pontos HV de um diretório de scan: [(HV, tamanho e mtime do CAEN.root, tamanho e mtime do output.json)] """
+    points = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            # Mesmo critério do glob "*_HV*_CAEN.root" usado antes para contar os pontos
+            if not fnmatch.fnmatch(entry.name, "*_HV*_CAEN.root"):
+                continue
+            match = point_pattern.search(entry.name)
+            HV = int(match.group(1)) if match else 0
+            st = entry.stat()
+            json_size, json_mtime = _stat(os.path.join(path, "ANALYSIS", "KODELE", f"HV{HV}", "output.json"))
+            points.append((HV, st.st_size, st.st_mtime_ns, json_size, json_mtime))
+    return sorted(points)
+
+
+class ScanCatalog:
+    """ Índice SQLite dos diretórios de scan e das configurações a que pertencem """
+
+    def __init__(self, path=default_catalog_file):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != CATALOG_VERSION:
+            self.db.executescript("DROP TABLE IF EXISTS scans; DROP TABLE IF EXISTS points; DROP TABLE IF EXISTS configs;")
+            self.db.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    def refresh(self, folder, year):
+        """ Atualiza os scans de uma pasta Scans_YYYY; devolve (novos, modificados, removidos) """
+        stored = {}
+        for scanId, *point in self.db.execute("SELECT scanId, HV, root_size, root_mtime_ns, json_size, json_mtime_ns "
+                                              "FROM points WHERE year = ? ORDER BY scanId, HV", (year,)):
+            stored.setdefault(scanId, []).append(tuple(point))
+        known = {scanId for (scanId,) in self.db.execute("SELECT scanId FROM scans WHERE year = ?", (year,))}
+        found, changed = set(), []
+        with span("catalog_refresh", year=year):
+            if os.path.isdir(folder):
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        match = scan_dir_pattern.match(entry.name)
+                        if not match or not entry.is_dir():
+                            continue
+                        scanId = match.group(1)
+                        found.add(scanId)
+                        # Assinatura de cada CAEN.root e output.json: um output.json reescrito
+                        # não muda o mtime do diretório do scan
+                        points = scan_points(entry.path)
+                        if scanId not in known or stored.get(scanId, []) != points:
+                            changed.append((scanId, entry.path, points))
+
+            removed = known - found
+            with self.db:
+                for scanId in removed:
+                    self._delete(year, scanId)
+                for scanId, path, points in changed:
+                    self._delete(year, scanId)
+                    mtime = max((max(point[2], point[4] or 0) for point in points), default=0)
+                    self.db.execute("INSERT INTO scans VALUES (?, ?, ?, ?, ?, ?)",
+                                    (year, scanId, path, mtime, len(points),
+                                     sum(point[1] + (point[3] or 0) for point in points)))
+                    self.db.executemany("INSERT INTO points VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        [(year, scanId, *point) for point in points])
+        n_new = sum(scanId not in known for scanId, _, _ in changed)
+        return n_new, len(changed) - n_new, len(removed)
+
+    def _delete(self, year, scanId):
+        self.db.execute("DELETE FROM scans WHERE year = ? AND scanId = ?", (year, scanId))
+        self.db.execute("DELETE FROM points WHERE year = ? AND scanId = ?", (year, scanId))
+
+    def set_configs(self, year, scans, wp_scans):
+        """ Registra os dicionários {'<mistura>_<ABS>': [scanIds]} de scans HV e WP de uma campanha """
+        rows = []
+        for configs, WP in ((scans, 0), (wp_scans, 1)):
+            for name, scanIds in configs.items():
+                mixture, ABS = name.split("_", 1)
+                rows += [(year, str(scanId), mixture, ABS_value(ABS), WP) for scanId in scanIds]
+        with self.db:
+            self.db.execute("DELETE FROM configs WHERE year = ?", (year,))
+            self.db.executemany("INSERT OR IGNORE INTO configs VALUES (?, ?, ?, ?, ?)", rows)
+
+    def signatures(self, year):
+        """ {scanId: pontos (HV, tamanhos e mtimes)} de todos os scans da campanha, para detectar mudanças """
+        signatures = {scanId: () for (scanId,) in self.db.execute("SELECT scanId FROM scans WHERE year = ?", (year,))}
+        for scanId, *point in self.db.execute("SELECT scanId, HV, root_size, root_mtime_ns, json_size, json_mtime_ns "
+                                              "FROM points WHERE year = ? ORDER BY scanId, HV", (year,)):
+            signatures[scanId] += (tuple(point),)
+        return signatures
+
+    def HV_points(self, year, scanId):
+        """ Número de arquivos CAEN.root do scan (0 se o scan não existe) """
+        row = self.db.execute("SELECT n_points FROM scans WHERE year = ? AND scanId = ?", (year, str(scanId))).fetchone()
+        return 0 if row is None else row[0]
+
+    def query(self, mixture=None, year=None, ABS_min=None, ABS_max=None, WP=None):
+        """ Scans das configurações pedidas, com número de pontos, tamanho e mtime; ABS "OFF" é inf """
+        conditions, values = [], []
+        for condition, value in (("c.mixture = ?", mixture), ("c.year = ?", year), ("c.ABS >= ?", ABS_min),
+                                 ("c.ABS <= ?", ABS_max), ("c.WP = ?", None if WP is None else int(WP))):
+            if value is not None:
+                conditions.append(condition)
+                values.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return pd.read_sql_query(
+            "SELECT c.year, c.mixture, c.ABS, c.WP, c.scanId, s.n_points, s.size, s.mtime_ns, s.path "
+            "FROM configs c LEFT JOIN scans s ON s.year = c.year AND s.scanId = c.scanId "
+            f"{where} ORDER BY c.year, c.mixture, c.ABS, c.WP, c.scanId", self.db, params=values)
+
+    def points(self, year, scanId):
+        return pd.read_sql_query("SELECT * FROM points WHERE year = ? AND scanId = ? ORDER BY HV",
+                                 self.db, params=(year, str(scanId)))
+
+
+def main():
+    from extract_data import campaign_catalog, campaigns, catalog_options
+
+    parser = argparse.ArgumentParser(description="Atualiza o catálogo de scans e lista as configurações pedidas")
+    parser.add_argument("years", nargs="*", type=int, help=f"campanhas entre {sorted(campaigns)} (padrão: todas)")
+    parser.add_argument("-m", "--mixture", default=None)
+    parser.add_argument("--abs-min", type=ABS_value, default=None, help="ABS mínimo (OFF = fonte desligada)")
+    parser.add_argument("--abs-max", type=ABS_value, default=None, help="ABS máximo")
+    parser.add_argument("--wp", action="store_true", help="só os scans no WP")
+    parser.add_argument("--hv", action="store_true", help="só os scans HV")
+    parser.add_argument("--catalog", default=default_catalog_file, help="arquivo SQLite do catálogo")
+    args = parser.parse_args()
+    if not set(args.years) <= set(campaigns):
+        parser.error(f"campanhas disponíveis: {sorted(campaigns)}")
+
+    catalog_options.update(path=args.catalog)
+    years = args.years or sorted(campaigns)
+    for year in years:
+        catalog = campaign_catalog(year)
+    WP = True if args.wp else False if args.hv else None
+    frames = [catalog.query(args.mixture, year, args.abs_min, args.abs_max, WP) for year in years]
+    table = pd.concat(frames, ignore_index=True)
+    table['ABS'] = table['ABS'].map(ABS_label)
+    print(table.drop(columns=['path']).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
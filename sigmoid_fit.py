@@ -0,0 +1,269 @@
+import numpy as np
+
+# Modelo: Emax/(1+exp(-Lambda*(x-HV50))), o mesmo TF1 usado nos scripts
+PAR_NAMES = ("Emax", "Lambda", "HV50")
+DEFAULT_P0 = (0.9, 0.01, 7000.)
+
+# Ponto de trabalho: WP = HV95 + 150 V, com HV95 em 95% do platô
+eff_fraction = 0.95
+WP_offset = 150.
+
+# Status do ajuste (mesma convenção do Minuit: 0 = convergiu)
+FIT_OK = 0
+FIT_MAX_ITER = 1
+FIT_INVALID = 2
+# O amortecimento passou de 1e12 sem melhorar o chi2 longe do mínimo (gradiente não nulo)
+FIT_STALLED = 3
+
+
+def sigmoid(x, Emax, Lambda, HV50):
+    arg = np.clip(-Lambda * (x - HV50), -700., 700.)
+    return Emax / (1. + np.exp(arg))
+
+
+def sigmoid_jacobian(x, p):
+    """ Derivadas analíticas de sigmoid em relação a (Emax, Lambda, HV50) """
+    Emax, Lambda, HV50 = p[:, 0:1], p[:, 1:2], p[:, 2:3]
+    s = sigmoid(x, 1., Lambda, HV50)
+    ds = Emax * s * (1. - s)
+    return np.stack([s, ds * (x - HV50), -ds * Lambda], axis=-1)
+
+
+def stack_scans(dfs, x_col='HV_top', y_col='efficiency', err_col='eff_error'):
+    """ Empilha os scans num array (n_scans, n_pontos) com máscara de pontos válidos """
+    # Sem scans, uma coluna vazia: o ajuste devolve um resultado com zero scans
+    n_points = max((len(df) for df in dfs), default=1)
+    x = np.zeros((len(dfs), n_points))
+    y = np.zeros((len(dfs), n_points))
+    err = np.ones((len(dfs), n_points))
+    mask = np.zeros((len(dfs), n_points), dtype=bool)
+    for i, df in enumerate(dfs):
+        n = len(df)
+        x[i, :n] = np.asarray(df[x_col])
+        y[i, :n] = np.asarray(df[y_col])
+        err[i, :n] = np.asarray(df[err_col])
+        # Assim como o TGraphErrors::Fit, pontos com erro zero são ignorados
+        mask[i, :n] = err[i, :n] > 0
+    err[~mask] = 1.
+    return x, y, err, mask
+
+
+def _crossing(x, y, mask, level):
+    """ HV em que cada scan cruza 'level' (interpolação linear), nan se não cruzar """
+    above = mask & (y >= level[:, None])
+    first = np.argmax(above, axis=1)
+    found = above.any(axis=1) & (first > 0)
+    i1 = first[:, None]
+    i0 = np.maximum(first - 1, 0)[:, None]
+    x0, x1 = np.take_along_axis(x, i0, 1)[:, 0], np.take_along_axis(x, i1, 1)[:, 0]
+    y0, y1 = np.take_along_axis(y, i0, 1)[:, 0], np.take_along_axis(y, i1, 1)[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = np.where(y1 > y0, (level - y0) / (y1 - y0), 0.5)
+    return np.where(found, x0 + frac * (x1 - x0), np.nan)
+
+
+def initial_guess(x, y, mask, n_top=3):
+    """ Parâmetros iniciais a partir dos dados: platô dos pontos de maior HV, HV50 do cruzamento de 50% """
+    n_scans = x.shape[0]
+    # Platô: média das n_top eficiências mais altas de cada scan
+    y_valid = np.where(mask, y, -np.inf)
+    top = np.sort(y_valid, axis=1)[:, -n_top:]
+    top_valid = np.isfinite(top)
+    Emax = np.where(top_valid.any(axis=1),
+                    np.sum(np.where(top_valid, top, 0.), axis=1) / np.maximum(top_valid.sum(axis=1), 1),
+                    DEFAULT_P0[0])
+
+    HV50 = _crossing(x, y, mask, 0.5 * Emax)
+    # Entre 25% e 75% do platô a sigmoide percorre 2*ln(3)/Lambda
+    width = _crossing(x, y, mask, 0.75 * Emax) - _crossing(x, y, mask, 0.25 * Emax)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        Lambda = 2. * np.log(3.) / width
+
+    p0 = np.empty((n_scans, 3))
+    p0[:, 0] = np.where(Emax > 0, Emax, DEFAULT_P0[0])
+    p0[:, 1] = np.where(np.isfinite(Lambda) & (Lambda > 0), Lambda, DEFAULT_P0[1])
+    p0[:, 2] = np.where(np.isfinite(HV50), HV50, DEFAULT_P0[2])
+    return p0
+
+
+def _solve(A, b):
+    try:
+        return np.linalg.solve(A, b[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        return np.einsum('nij,nj->ni', np.linalg.pinv(A), b)
+
+
+def levenberg_marquardt(residuals, jacobian, p0, active, max_iter=200, tol=1e-10):
+    """ Levenberg-Marquardt vetorizado sobre n problemas independentes (um passo para todos os ativos por iteração)
+
+    residuals(idx, p): resíduos ponderados (len(idx), n_pontos) dos problemas idx com parâmetros p;
+    jacobian(idx, p): derivadas (len(idx), n_pontos, n_par) do modelo nesses pontos, com o mesmo peso;
+    p0: (n, n_par); active: problemas com graus de liberdade (os demais saem FIT_INVALID).
+    Devolve p, chi2, status e niter de cada problema.
+    """
+    p = np.array(p0, dtype=float)
+    n, n_par = p.shape
+    damping = np.full(n, 1e-3)
+    chi2 = np.sum(residuals(np.arange(n), p)**2, axis=1)
+    niter = np.zeros(n, dtype=int)
+    active = np.array(active, dtype=bool)
+    status = np.where(active, FIT_MAX_ITER, FIT_INVALID)
+
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        idx = np.flatnonzero(active)
+        pa = p[idx]
+        J = jacobian(idx, pa)
+        r = residuals(idx, pa)
+        A = np.einsum('npi,npj->nij', J, J)
+        g = np.einsum('npi,np->ni', J, r)
+
+        diag = np.maximum(np.diagonal(A, axis1=1, axis2=2), 1e-300)
+        A_damped = A + damping[idx, None, None] * diag[:, :, None] * np.eye(n_par)
+        p_new = pa + _solve(A_damped, g)
+        chi2_new = np.sum(residuals(idx, p_new)**2, axis=1)
+
+        better = np.isfinite(chi2_new) & (chi2_new <= chi2[idx])
+        converged = better & (chi2[idx] - chi2_new <= tol * np.maximum(chi2_new, 1.))
+        p[idx[better]] = p_new[better]
+        chi2[idx[better]] = chi2_new[better]
+        damping[idx] = np.where(better, damping[idx] / 10., damping[idx] * 10.)
+        niter[idx] += 1
+
+        # Amortecimento muito alto: o passo não melhora mais o chi2. Só conta como convergido
+        # se já está no mínimo, isto é, se o passo de Gauss-Newton (g A^-1 g) reduziria o chi2
+        # menos do que a tolerância
+        stalled = ~better & (damping[idx] > 1e12)
+        if stalled.any():
+            with np.errstate(invalid='ignore'):
+                decrease = np.einsum('ni,ni->n', g[stalled], _solve(A[stalled], g[stalled]))
+                at_minimum = decrease <= tol * np.maximum(chi2[idx[stalled]], 1.)
+            status[idx[stalled]] = np.where(at_minimum, FIT_OK, FIT_STALLED)
+        status[idx[converged]] = FIT_OK
+        active[idx[converged | stalled]] = False
+    return p, chi2, status, niter
+
+
+def fit_sigmoid_batch(x, y, err, mask, p0=None, max_iter=200, tol=1e-10):
+    """ Ajusta a sigmoide a todos os scans de uma vez (Levenberg-Marquardt vetorizado)
+
+    p0: (3,) ou (n_scans, 3); None usa initial_guess dos próprios dados.
+    """
+    n_scans = x.shape[0]
+    if p0 is None:
+        p0 = initial_guess(x, y, mask)
+    p0 = np.broadcast_to(np.asarray(p0, dtype=float), (n_scans, 3))
+    ndf = mask.sum(axis=1) - 3
+    w = np.where(mask, 1. / err, 0.)
+
+    def residuals(idx, p):
+        r = (y[idx] - sigmoid(x[idx], p[:, 0:1], p[:, 1:2], p[:, 2:3])) / err[idx]
+        return np.where(mask[idx], r, 0.)
+
+    def jacobian(idx, p):
+        return sigmoid_jacobian(x[idx], p) * w[idx][..., None]
+
+    p, chi2, status, niter = levenberg_marquardt(residuals, jacobian, p0, ndf > 0, max_iter, tol)
+
+    J = sigmoid_jacobian(x, p) * w[..., None]
+    A = np.einsum('npi,npj->nij', J, J)
+    cov = np.full((n_scans, 3, 3), np.nan)
+    ok = ndf > 0
+    if ok.any():
+        cov[ok] = np.linalg.pinv(A[ok])
+
+    return {
+        'Emax': p[:, 0], 'Lambda': p[:, 1], 'HV50': p[:, 2],
+        'params': p, 'cov': cov, 'chi2': chi2, 'ndf': ndf,
+        'status': status, 'niter': niter,
+    }
+
+
+def fit_sigmoid_dfs(dfs, p0=None):
+    """ Atalho: empilha uma lista de DataFrames de scans HV e ajusta todos """
+    return fit_sigmoid_batch(*stack_scans(dfs), p0=p0)
+
+
+def fit_sigmoid_chains(x, y, err, mask, chains, max_iter=200, tol=1e-10, known=None):
+    """ Ajuste com warm start: cada scan de uma cadeia (ex.: ABS de uma mistura) parte do
+    resultado do scan anterior. Os k-ésimos scans de todas as cadeias são ajustados juntos.
+
+    known: (índices, resultado) de scans já ajustados (ex.: do cache de ajustes); eles não são
+    reajustados, mas servem de ponto de partida para o scan seguinte da cadeia. """
+    n_scans = x.shape[0]
+    p0 = initial_guess(x, y, mask)
+    result = {
+        'params': np.array(p0), 'cov': np.full((n_scans, 3, 3), np.nan),
+        'chi2': np.zeros(n_scans), 'ndf': mask.sum(axis=1) - 3,
+        'status': np.full(n_scans, FIT_INVALID), 'niter': np.zeros(n_scans, dtype=int),
+    }
+    done = np.zeros(n_scans, dtype=bool)
+    if known is not None:
+        indices, fitted = known
+        for name in result:
+            result[name][indices] = fitted[name]
+        done[indices] = True
+    for k in range(max((len(chain) for chain in chains), default=0)):
+        active = [chain for chain in chains if len(chain) > k and not done[chain[k]]]
+        if not active:
+            continue
+        idx = np.array([chain[k] for chain in active])
+        start = p0[idx]
+        if k > 0:
+            previous = np.array([chain[k - 1] for chain in active])
+            ok = result['status'][previous] == FIT_OK
+            start[ok] = result['params'][previous[ok]]
+        wave = fit_sigmoid_batch(x[idx], y[idx], err[idx], mask[idx], start, max_iter, tol)
+        for name in result:
+            result[name][idx] = wave[name]
+    result['Emax'], result['Lambda'], result['HV50'] = result['params'].T
+    return result
+
+
+def fit_report(result):
+    """ Resumo de convergência: número de ajustes por status e iterações """
+    niter = result['niter']
+    return (f"{len(niter)} ajustes: {np.sum(result['status'] == FIT_OK)} convergiram, "
+            f"{np.sum(result['status'] == FIT_MAX_ITER)} atingiram o limite de iterações, "
+            f"{np.sum(result['status'] == FIT_STALLED)} pararam fora do mínimo, "
+            f"{np.sum(result['status'] == FIT_INVALID)} inválidos; "
+            f"iterações: média {niter.mean() if len(niter) else 0.:.1f}, máx {niter.max(initial=0)}, total {niter.sum()}")
+
+
+def take_fits(result, indices):
+    """ Seleciona um subconjunto dos scans de um resultado de fit_sigmoid_batch """
+    return {name: value[indices] for name, value in result.items()}
+
+
+def concat_fits(results):
+    """ Junta, na ordem, resultados de fit_sigmoid_batch de blocos de scans (nenhum bloco: zero scans) """
+    if not results:
+        return fit_sigmoid_batch(*stack_scans([]))
+    return {name: np.concatenate([result[name] for result in results]) for name in results[0]}
+
+
+def _propagate(grad, cov):
+    return np.sqrt(np.einsum('ni,nij,nj->n', grad, cov, grad))
+
+
+def derive_working_points(result, fraction=eff_fraction, offset=WP_offset):
+    """ HV50, HV95, WP e Eff(WP) de todos os scans em forma fechada, com erros propagados da covariância """
+    Emax, Lambda, HV50 = result['params'].T
+    cov = result['cov']
+    c = np.log(fraction / (1. - fraction))
+    zeros, ones = np.zeros_like(Lambda), np.ones_like(Lambda)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        HV95 = HV50 + c / Lambda
+        # Eff(WP) só depende de Emax e Lambda: WP - HV50 = c/Lambda + offset
+        s = 1. / (1. + np.exp(-(c + Lambda * offset)))
+        grad_HV95 = np.stack([zeros, -c / Lambda**2, ones], axis=1)
+        grad_eff = np.stack([s, Emax * s * (1. - s) * offset, zeros], axis=1)
+
+    return {
+        'HV50': HV50, 'HV50_err': np.sqrt(cov[:, 2, 2]),
+        'HV95': HV95, 'HV95_err': _propagate(grad_HV95, cov),
+        'WP': HV95 + offset, 'WP_err': _propagate(grad_HV95, cov),
+        'Eff_WP': Emax * s, 'Eff_WP_err': _propagate(grad_eff, cov),
+    }
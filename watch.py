@@ -0,0 +1,151 @@
+import argparse
+import os
+import time
+
+from campaign_store import clear_loaded, csv_files, scan_key
+from extract_data import (campaign_catalog, campaign_jobs, campaign_scans, campaigns, clear_catalog, export_jobs,
+                          scan_map_name)
+from extraction_cache import ExtractionCache, default_cache_file
+from lazy_root import set_batch
+from persistent_cache import file_signature
+from pipeline import (ABS_spec, bkg_spec, build_fit_table, campaign_folders, overlay_specs, refit_files,
+                      render_options, scan_specs)
+from render import render_many
+from wp_index import clear_wp_index
+
+# Modo de acompanhamento durante um test beam: a cada 'interval' segundos
+# procura pontos HV novos em todos os Scan_00XXXX (catálogo de scans), extrai
+# só as configurações afetadas, reajusta só os scans cujos CSVs mudaram e
+# redesenha só os gráficos que dependem deles. Configurações novas refazem a
+# tabela de ajustes (os scans inalterados vêm do cache de ajustes).
+
+
+def config_scans(year):
+    """ {configuração: scans HV e WP que a compõem}, refeito a cada verificação (dicionários + scans.toml) """
+    scans, wp_scans = campaign_scans(year)
+    configs = {name: set(scanIds) for name, scanIds in scans.items()}
+    for name, scanIds in wp_scans.items():
+        configs.setdefault(name, set()).update(scanIds)
+    return configs
+
+
+def scan_state(year):
+    """ Assinaturas de todos os Scan_00XXXX da campanha, pelo catálogo (que só regrava os scans alterados) """
+    clear_catalog()
+    return campaign_catalog(year).signatures(year)
+
+
+def csv_state(data_folder):
+    return {file: file_signature(file) for file in csv_files(data_folder)} if os.path.isdir(data_folder) else {}
+
+
+def changed_keys(old, new):
+    return {key for key in new if old.get(key) != new[key]}
+
+
+def extract_changed(year, data_folder, seen, workers, cache):
+    """ Reextrai as configurações com scans novos ou modificados, ou cuja lista de scans mudou
+
+    seen: (assinaturas dos scans, {configuração: scans}) da verificação anterior; devolve o estado atual.
+    """
+    scans_before, configs_before = seen
+    scans_now = scan_state(year)
+    configs = config_scans(year)
+    changed = changed_keys(scans_before, scans_now)
+    mapped = set().union(*configs.values())
+    if changed - mapped:
+        print(f"[{year}] scans sem configuração: {', '.join(sorted(changed - mapped))} "
+              f"(acrescente em {os.path.join(campaigns[year]['folder'], scan_map_name)})")
+    names = sorted(name for name, scanIds in configs.items()
+                   if scanIds & changed or configs_before.get(name) != scanIds)
+    if not names:
+        return scans_now, configs
+    print(f"[{year}] scans alterados: {', '.join(sorted(changed & mapped)) or '-'} -> {', '.join(names)}")
+    try:
+        failed = export_jobs(campaign_jobs(year, names), year, data_folder, workers, cache, skip_failed=True)
+    except OSError as error:
+        print(f"Aviso: extração de {', '.join(names)} falhou ({error}); nova tentativa em seguida")
+        failed = [f"{name}.csv" for name in names]
+    # Ponto ainda sendo escrito (ex: CAEN.root sem output.json): a configuração fica pendente
+    # e é reextraída na próxima verificação; as demais já foram gravadas
+    for filename in failed:
+        name = os.path.splitext(filename)[0].removesuffix("_WP")
+        configs = {**configs, name: None}
+    return scans_now, configs
+
+
+def figure_specs(table, fits, scans, indices):
+    """ Gráficos que dependem das linhas 'indices' da tabela de ajustes """
+    changed = table.loc[indices]
+    groups = set(zip(changed['year'], changed['mixture']))
+    in_groups = [(year, mixture) in groups for year, mixture in zip(table['year'], table['mixture'])]
+    return ([ABS_spec(table), bkg_spec(table)] + overlay_specs(table[in_groups], fits, scans)
+            + scan_specs(changed, fits, scans))
+
+
+def watch(years, interval=10., workers=None, cache=None, formats=None, once=False):
+    folders = {year: campaign_folders.get(year, f"data_{year}") for year in years}
+    seen = {year: (scan_state(year), config_scans(year)) for year in years}
+    csv_seen = {year: csv_state(folder) for year, folder in folders.items()}
+    # A tabela cobre todas as campanhas: os gráficos comparam 2024 com 2023
+    table, fits, scans = build_fit_table()
+    print(f"Acompanhando {', '.join(campaigns[year]['folder'] for year in years)} a cada {interval:g} s")
+
+    while True:
+        time.sleep(interval)
+        start = time.perf_counter()
+        changed_files = set()
+        for year, data_folder in folders.items():
+            seen[year] = extract_changed(year, data_folder, seen[year], workers, cache)
+            csv_now = csv_state(data_folder)
+            changed_files |= changed_keys(csv_seen[year], csv_now)
+            csv_seen[year] = csv_now
+        new_configs = {file for file in changed_files
+                       if not file.endswith("_WP.csv") and scan_key(file) is not None and file not in set(table['file'])}
+        if new_configs:
+            print(f"Configurações novas: {', '.join(sorted(os.path.basename(file) for file in new_configs))}")
+            clear_loaded()
+            clear_wp_index()
+            table, fits, scans = build_fit_table()
+            changed_files |= new_configs
+        if changed_files:
+            try:
+                indices = refit_files(table, fits, scans, changed_files)
+            except (OSError, KeyError, ValueError) as error:
+                print(f"Aviso: reajuste falhou ({error}); nova tentativa em seguida")
+                for year in folders:
+                    csv_seen[year] = {file: signature for file, signature in csv_seen[year].items()
+                                      if file not in changed_files}
+                indices = []
+            if len(indices):
+                outputs = render_many(figure_specs(table, fits, scans, indices), workers, formats)
+                print(f"{len(indices)} scans reajustados, {sum(len(files) for files in outputs)} arquivos "
+                      f"redesenhados em {time.perf_counter() - start:.1f} s")
+        if once:
+            return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Acompanha os scans durante o test beam: extrai, reajusta e redesenha o que mudou")
+    parser.add_argument("years", nargs="*", type=int, help=f"campanhas entre {sorted(campaigns)} (padrão: 2024)")
+    parser.add_argument("-i", "--interval", type=float, default=10., help="segundos entre verificações")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processos para extração e gráficos (padrão: todos os núcleos)")
+    parser.add_argument("--formats", nargs="+", default=None, help="formatos dos gráficos (ex: pdf png)")
+    parser.add_argument("--cache", default=default_cache_file, help="arquivo do cache de extração")
+    parser.add_argument("--no-cache", action="store_true", help="relê todos os pontos das configurações alteradas")
+    parser.add_argument("--once", action="store_true", help="faz uma única verificação e sai")
+    args = parser.parse_args()
+    if not set(args.years) <= set(campaigns):
+        parser.error(f"campanhas disponíveis: {sorted(campaigns)}")
+
+    set_batch(True)
+    render_options.update(workers=args.workers, formats=args.formats)
+    cache = None if args.no_cache else ExtractionCache(args.cache)
+    try:
+        watch(args.years or [2024], args.interval, args.workers, cache, args.formats, args.once)
+    except KeyboardInterrupt:
+        print("Encerrado")
+
+
+if __name__ == "__main__":
+    main()
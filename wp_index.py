@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from campaign_store import folder_year, parse_scan_name, scan_key
+from persistent_cache import file_signature
+
+# Índice dos pontos de trabalho: (ano, mistura, ABS) -> taxa de background,
+# corrente e eficiência do _WP.csv. Gravado em <pasta>/wp_index.json e
+# refeito só para os arquivos _WP cuja assinatura (mtime, tamanho) mudou.
+
+index_name = "wp_index.json"
+INDEX_VERSION = 1
+
+# Índices já carregados neste processo (pasta -> {(ano, mistura, ABS): entrada})
+_indexes = {}
+
+
+def index_path(data_folder):
+    return os.path.join(data_folder, index_name)
+
+
+def WP_files(data_folder):
+    return sorted(entry.path for entry in os.scandir(data_folder)
+                  if entry.is_file() and entry.name.endswith("_WP.csv") and scan_key(entry.name) is not None)
+
+
+def read_WP_entry(WP_file):
+    """ Primeira linha do _WP: taxa de background (kHz/cm2), corrente e eficiência no WP """
+    df = pd.read_csv(WP_file, nrows=1)
+    entry = {'bkg': np.nan, 'current': np.nan, 'efficiency': np.nan, 'HV_top': np.nan}
+    if {'noiseGammaRate', 'gamma_CS'}.issubset(df.columns):
+        entry['bkg'] = float(df['noiseGammaRate'][0] / (df['gamma_CS'][0] * 1000))
+    if 'current' in df:
+        entry['current'] = float(df['current'][0])
+    for column in ('efficiency', 'HV_top'):
+        if column in df:
+            entry[column] = float(df[column][0])
+    return entry
+
+
+def _load(data_folder):
+    path = index_path(data_folder)
+    if os.path.isfile(path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                return data['files']
+        except (OSError, ValueError, KeyError):
+            print(f"Aviso: índice '{path}' ilegível, refazendo")
+    return {}
+
+
+def build_index(data_folder):
+    """ Atualiza o índice da pasta: relê só os _WP novos ou modificados e grava o JSON se algo mudou """
+    stored = _load(data_folder)
+    files, changed = {}, False
+    for WP_file in WP_files(data_folder):
+        name = os.path.basename(WP_file)
+        signature = file_signature(WP_file)
+        if name in stored and stored[name]['signature'] == signature:
+            files[name] = stored[name]
+        else:
+            files[name] = {'signature': signature, **read_WP_entry(WP_file)}
+            changed = True
+    if changed or set(files) != set(stored):
+        tmp = index_path(data_folder) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({'version': INDEX_VERSION, 'files': files}, f)
+        os.replace(tmp, index_path(data_folder))
+
+    year = folder_year(data_folder)
+    index = {}
+    for name, entry in files.items():
+        mixture, ABS, _ = parse_scan_name(name)
+        index[(year, mixture, ABS)] = {key: value for key, value in entry.items() if key != 'signature'}
+    return index
+
+
+def wp_index(data_folder):
+    data_folder = os.path.normpath(data_folder)
+    if data_folder not in _indexes:
+        _indexes[data_folder] = build_index(data_folder)
+    return _indexes[data_folder]
+
+
+def clear_wp_index():
+    _indexes.clear()
+
+
+def WP_entry(WP_file):
+    """ Entrada do índice para um caminho data_YYYY/<mistura>_<ABS>_WP.csv, ou None se o arquivo não existe
+
+    Arquivos fora do padrão de nomes são lidos diretamente, sem passar pelo índice.
+    """
+    data_folder = os.path.dirname(WP_file) or "."
+    if not os.path.isdir(data_folder):
+        return None
+    if scan_key(WP_file) is None:
+        return read_WP_entry(WP_file) if os.path.isfile(WP_file) else None
+    mixture, ABS, _ = parse_scan_name(WP_file)
+    return wp_index(data_folder).get((folder_year(data_folder), mixture, ABS))
+
+
+def bkg_rate(WP_file):
+    entry = WP_entry(WP_file)
+    return np.nan if entry is None else entry['bkg']
+